@@ -0,0 +1,87 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# 这是一个选课前的测量脚本，测量到教务系统的往返时间、服务器处理时间和时钟偏差，
+# 并给出推荐的选课参数。脚本只读取选课页面和课程数据，不会选课或退课。
+# 加上“--throttle”参数时还会探测服务器的限流阈值。探测会用你的账号不断加快请求
+# 直到被限流，只能在选课开始之前很久（例如前一天）运行，切勿在即将开始选课时使用。
+
+import getpass
+import os
+import sys
+import warnings
+
+from examples.elect_course import login
+from suep_toolkit import auth
+from suep_toolkit import course as course_system
+from suep_toolkit.calibrate import ElectionCalibrator
+from suep_toolkit.util import AuthServiceError, VPNError
+
+
+def main(samples: int, throttle: bool) -> int:
+    warnings.simplefilter("ignore")
+    if "SUEP_USERNAME" in os.environ and "SUEP_PASSWORD" in os.environ:
+        service = auth.AuthService(
+            os.environ["SUEP_USERNAME"], os.environ["SUEP_PASSWORD"]
+        )
+    else:
+        service = auth.AuthService(input("用户名: "), getpass.getpass("密码: "))
+    try:
+        login(service)
+    except AuthServiceError:
+        print("登陆失败")
+        return 1
+    try:
+        course_mgr = course_system.CourseManagement(service.session)
+    except VPNError:
+        print("需要先启动 VPN")
+        return 1
+    print("正在测量, 请稍候...")
+    try:
+        report = ElectionCalibrator(course_mgr, samples).run(throttle)
+    except KeyboardInterrupt:
+        return 0
+    except:
+        print("测量失败, 请重试")
+        return 1
+    print(report.histogram())
+    print()
+    print(f"时钟偏差: {report.clock_offset * 1000:+.0f} ms", end="")
+    print(f" (±{report.clock_uncertainty * 1000:.0f} ms)")
+    if not throttle:
+        print("限流阈值: 未探测")
+    elif report.throttle_interval is None:
+        print("限流阈值: 未触发")
+    else:
+        print(f"限流阈值: {report.throttle_interval * 1000:.0f} ms")
+    config = report.config
+    print("推荐的选课参数:")
+    print(f"  连接数: {config.connections}")
+    print(f"  同时发出的请求数: {config.in_flight}")
+    print(f"  重试间隔: {config.retry_interval * 1000:.0f} ms")
+    print(f"  提前发出请求: {config.lead_time * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--throttle"]
+    exit(main(int(args[0]) if len(args) > 0 else 20, "--throttle" in sys.argv))
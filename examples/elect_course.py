@@ -22,19 +22,49 @@
 
 # 这是一个自动化选课脚本，帮助你快速选到心仪的课程。
 # 你唯一需要做的就是以命令行参数传递一个选课列表文件，然后根据程序的提示输入一些信息。
-# 选课列表文件的每一行都是一个教务系统上的课程序号（形如“xxxxxxx.xx”，其中“x”代表一位数字）。
+# 选课列表文件的每一行都是一个志愿，包含一个或多个用空格隔开的教务系统上的课程序号
+# （形如“xxxxxxx.xx”，其中“x”代表一位数字），靠前的课程序号优先。越靠前的志愿越优先。
+# 脚本会预先排除时间冲突的课程，某个课程已满时自动改选同一志愿中的其它课程。
+# 开始选课前脚本会先测量网络状况（见 examples/calibrate_election.py），按推荐的参数
+# 同时选方案中的前几门课程，并控制重试的间隔。
 
 import getpass
 import os
 import sys
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from suep_toolkit import auth
 from suep_toolkit import course as course_system
+from suep_toolkit.calibrate import ElectionCalibrator, ElectionConfig
+from suep_toolkit.planner import ElectionPlanner
 from suep_toolkit.util import AuthServiceError, VPNError
 
 
+def login(service: auth.AuthService) -> None:
+    # 优先自动识别验证码，没有安装依赖、没有训练好的模型或者识别失败时再手动输入。
+    try:
+        service.login(auto_captcha=True)
+        return
+    except ImportError:
+        pass
+    except AuthServiceError as error:
+        if str(error) not in (
+            "no trained captcha model",
+            "failed to recognize the captcha",
+        ):
+            raise
+    captcha_image = service.check_captcha()
+    if captcha_image is not None:
+        with open("captcha.jpg", "wb") as f:
+            f.write(captcha_image)
+        service.set_captcha_code(input("验证码: "))
+        os.remove("captcha.jpg")
+    service.login()
+
+
 def main(courses_file: Path) -> int:
     warnings.simplefilter("ignore")
     if not courses_file.exists():
@@ -46,13 +76,8 @@ def main(courses_file: Path) -> int:
         )
     else:
         service = auth.AuthService(input("用户名: "), getpass.getpass("密码: "))
-    if service.need_captcha():
-        with open("captcha.jpg", "wb") as f:
-            f.write(service.get_captcha_image())
-        service.set_captcha_code(input("验证码: "))
-        os.remove("captcha.jpg")
     try:
-        service.login()
+        login(service)
     except AuthServiceError:
         print("登陆失败")
         return 1
@@ -66,38 +91,73 @@ def main(courses_file: Path) -> int:
     except:
         print("读取课程列表失败, 请重试")
         return 1
-    wanted_list = []
-    success_list = []
+    courses = {course.no: course for course in electable_course}
+    wishes = []
     for line in courses_file.read_text().splitlines():
-        course_no = line.strip()
-        for course in electable_course:
-            if course._no == course_no:
-                wanted_list.append(course)
-    print("已选课程:")
-    for course in wanted_list:
-        print(f"{course._no} - {course.name}")
+        wish = [
+            courses[course_no] for course_no in line.split() if course_no in courses
+        ]
+        if len(wish) > 0:
+            wishes.append(wish)
+    planner = ElectionPlanner(wishes)
+    print("选课方案:")
+    for course in planner.plan:
+        print(f"{course.no} - {course.name}")
+    print("正在测量网络状况...")
+    try:
+        config = ElectionCalibrator(course_mgr, samples=10).run().config
+    except KeyboardInterrupt:
+        return 0
+    except:
+        print("测量失败, 使用默认参数")
+        config = ElectionConfig(1, 1, 0.2, 0.0)
+    print(
+        f"同时选 {config.in_flight} 门课程, 重试间隔 {config.retry_interval * 1000:.0f} ms"
+    )
     print("按下回车开始选课: ", end="")
     try:
         input()
     except KeyboardInterrupt:
         print()
         return 0
-    while len(success_list) != len(wanted_list):
-        for course in wanted_list:
-            if course.id in success_list:
-                continue
+
+    def elect(course: course_system.Course) -> str | None:
+        try:
+            course.elect()
+        except course_system.ElectCourseError as error:
+            return error.error
+        return None
+
+    with ThreadPoolExecutor(config.in_flight) as executor:
+        while not planner.finished:
+            # 方案改变之后立即按新方案继续选课。
+            batch = planner.plan[: config.in_flight]
+            started = time.monotonic()
             try:
-                course.elect()
-                print(f"{course.name}: 选课成功")
-                success_list.append(course.id)
-            except course_system.ElectCourseError as error:
-                if "已经选过" in error.error:
-                    success_list.append(course.id)
-                print(f"{course.name}: {error.error}")
+                errors = list(executor.map(elect, batch))
             except KeyboardInterrupt:
                 return 0
             except:
                 return 0
+            for course, error in zip(batch, errors):
+                if error is None:
+                    print(f"{course.name}: 选课成功")
+                    planner.mark_elected(course)
+                    continue
+                print(f"{course.name}: {error}")
+                if "已经选过" in error:
+                    planner.mark_elected(course)
+                elif any(s in error for s in ["已满", "上限", "冲突"]):
+                    planner.mark_full(course)
+            try:
+                time.sleep(
+                    max(0.0, config.retry_interval - (time.monotonic() - started))
+                )
+            except KeyboardInterrupt:
+                return 0
+    print("已选上:")
+    for course in planner.elected:
+        print(f"{course.no} - {course.name}")
     return 0
 
 
@@ -0,0 +1,66 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# 这是一个训练验证码识别模型的脚本。
+# 先用 `python -m examples.train_captcha collect <目录> <数量>` 下载一批验证码，
+# 把每个文件重命名为图片中的验证码（如“a3k9.jpg”）之后，再用
+# `python -m examples.train_captcha train <目录>` 训练模型。
+# 五分之一的样本不参与训练，用于测试模型的准确率和耗时。
+# 训练好的模型保存在缓存目录中，`AuthService.login(auto_captcha=True)` 会自动读取它。
+
+import random
+import sys
+from pathlib import Path
+
+from suep_toolkit.captcha import CaptchaSolver, collect_samples, load_samples
+
+
+def main(command: str, directory: Path, count: int) -> int:
+    if command == "collect":
+        paths = collect_samples(directory, count)
+        print(f"已下载 {len(paths)} 张验证码，请在标注之后开始训练")
+        return 0
+    samples = load_samples(directory)
+    if len(samples) < 10:
+        print("标注好的样本太少了")
+        return 1
+    random.Random(0).shuffle(samples)
+    held_out = len(samples) // 5
+    solver = CaptchaSolver()
+    solver.train(samples[held_out:])
+    result = solver.benchmark(samples[:held_out])
+    print(f"测试样本: {result.samples}")
+    print(f"准确率: {result.accuracy:.1%} (单个字符 {result.char_accuracy:.1%})")
+    print(f"平均耗时: {result.mean_ms:.2f} ms (P95 {result.p95_ms:.2f} ms)")
+    solver.save()
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "collect":
+        exit(main("collect", Path(sys.argv[2]), int(sys.argv[3])))
+    elif len(sys.argv) == 3 and sys.argv[1] == "train":
+        exit(main("train", Path(sys.argv[2]), 0))
+    else:
+        print("用法: python -m examples.train_captcha collect <目录> <数量>")
+        print("      python -m examples.train_captcha train <目录>")
+        exit(1)
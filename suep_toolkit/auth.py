@@ -21,13 +21,25 @@
 # SOFTWARE.
 
 
+import contextvars
+import inspect
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable
+from urllib.parse import urlparse
 
 import requests
 from bs4 import BeautifulSoup
 
-from suep_toolkit import user_agent
-from suep_toolkit.util import AuthServiceError
+from suep_toolkit import breaker, deadline, httpcache, ratelimit, user_agent
+from suep_toolkit.httpcache import ResponseCache
+from suep_toolkit.util import AuthServiceError, VPNError, test_network
+
+if TYPE_CHECKING:
+    from suep_toolkit.captcha import CaptchaSolver
 
 
 class AuthService:
@@ -43,12 +55,35 @@ class AuthService:
         user_name: str,
         password: str,
         remember_me: bool = False,
+        rate_limit: bool = True,
+        circuit_breaker: bool = True,
+        response_cache: bool = True,
         **kwargs,
     ) -> None:
         self._kwargs = kwargs
+        self._user_name = user_name
+        self._password = password
+        self._remember_me = remember_me
+        self._solver: "CaptchaSolver | None" = None
 
         self._session = requests.Session()
         self._session.headers["User-Agent"] = user_agent
+        # 截止时间直接作用在实际发送的请求上，因此放在最内层。
+        deadline.install(self._session)
+        if circuit_breaker:
+            # 熔断器在限流之内，等待令牌的时间不计入请求的耗时。
+            breaker.install(self._session)
+        if rate_limit:
+            # 同一台机器上的所有进程共享每个主机的请求限额。
+            ratelimit.install(self._session)
+        self._response_cache: ResponseCache | None = None
+        if response_cache:
+            # 缓存在限流之外，命中缓存的请求不消耗限额。
+            self._response_cache = ResponseCache(user_name)
+            httpcache.install(self._session, self._response_cache)
+        self._prepare()
+
+    def _prepare(self) -> None:
         response = self._session.get(
             self.login_url,
             params=self._kwargs,
@@ -59,8 +94,8 @@ class AuthService:
         if len(dom.select("div#msg.errors")) > 0:
             raise AuthServiceError("unregistered application")
         # 以下字典存储的是 web 端登陆界面中表单里的各个字段名和值。
-        self._form_data = {"username": user_name, "password": password}
-        if remember_me:
+        self._form_data = {"username": self._user_name, "password": self._password}
+        if self._remember_me:
             self._form_data["rememberMe"] = "on"
         # 获取不在浏览器中显示的 input 标签的字段名和值，它们对于登陆来说也是必须的。
         # 这些值可能是随机的生成的，需要解析 HTML 并获取。
@@ -74,20 +109,18 @@ class AuthService:
     def session(self) -> requests.Session:
         return self._session
 
+    @property
+    def response_cache(self) -> ResponseCache | None:
+        """会话使用的响应缓存，没有启用时为 `None`。"""
+        return self._response_cache
+
     def need_captcha(self) -> bool:
         """检查需要登陆的用户是否需要填写验证码。"""
         if self._status != 0:
             raise AuthServiceError("wrong auth step")
         self._status += 1
 
-        # 是否需要填写验证码是动态获取的，其核心逻辑未知。
-        response = self._session.get(
-            self.need_captcha_url,
-            params={"username": self._form_data["username"], "_": int(time.time())},
-        )
-        response.raise_for_status()
-
-        if "true" in response.text:
+        if self._query_need_captcha():
             self._need_captcha = True
             return True
         self._status += 1
@@ -100,7 +133,38 @@ class AuthService:
         """
         if self._status != 1:
             raise AuthServiceError("wrong auth step")
+        return self._fetch_captcha_image()
+
+    def check_captcha(self) -> bytes | None:
+        """同时检查是否需要验证码并获取验证码。
+
+        相当于先后调用 `need_captcha()` 和 `get_captcha_image()`，但两个请求是同时
+        发出的。不需要验证码时返回 `None`。
+        """
+        if self._status != 0:
+            raise AuthServiceError("wrong auth step")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            need_captcha = executor.submit(self._query_need_captcha)
+            captcha_image = executor.submit(self._fetch_captcha_image)
+            if not need_captcha.result():
+                self._status = 2
+                return None
+            image = captcha_image.result()
+        self._status = 1
+        self._need_captcha = True
+        return image
 
+    def _query_need_captcha(self) -> bool:
+        # 是否需要填写验证码是动态获取的，其核心逻辑未知。
+        response = self._session.get(
+            self.need_captcha_url,
+            params={"username": self._form_data["username"], "_": int(time.time())},
+        )
+        response.raise_for_status()
+        return "true" in response.text
+
+    def _fetch_captcha_image(self) -> bytes:
         response = self._session.get(
             self.captcha_image_url,
             params={"ts": int(time.time())},
@@ -122,28 +186,277 @@ class AuthService:
             self._form_data["captchaResponse"] = captcha_code
             self._status += 1
 
-    def login(self):
-        """登陆。"""
+    def login(
+        self,
+        auto_captcha: bool = False,
+        *,
+        solver: "CaptchaSolver | None" = None,
+        attempts: int = 5,
+    ) -> None:
+        """登陆。
+
+        若 `auto_captcha` 为真，则在需要验证码时用 `solver`（默认读取缓存目录中
+        训练好的模型）自动识别。识别结果不够可信或验证码错误时会换一张验证码重试，
+        最多尝试 `attempts` 次。自动识别需要安装 `suep_toolkit[captcha]`。
+        """
+        if auto_captcha:
+            self._login_with_solver(solver, attempts)
+            return
         if self._need_captcha and "captchaResponse" not in self._form_data:
             raise AuthServiceError("must provide the captcha code")
         if self._status != 2:
             raise AuthServiceError("wrong auth step")
 
-        self._session.post(
+        response = self._session.post(
             self.login_url,
             params=self._kwargs,
             data=self._form_data,
-        ).raise_for_status()
+        )
+        response.raise_for_status()
 
         if not (
             "iPlanetDirectoryPro" in self._session.cookies
             and "CASTGC" in self._session.cookies
         ):
+            dom = BeautifulSoup(response.text, features="html.parser")
+            if any("验证码" in element.text for element in dom.select("#msg")):
+                raise AuthServiceError("wrong captcha code")
             raise AuthServiceError("wrong username or password")
 
+    def _login_with_solver(self, solver: "CaptchaSolver | None", attempts: int) -> None:
+        from suep_toolkit.captcha import CaptchaSolver
+
+        if solver is None:
+            try:
+                solver = CaptchaSolver.load()
+            except OSError as error:
+                raise AuthServiceError("no trained captcha model") from error
+        self._solver = solver
+
+        for _ in range(attempts):
+            if self._status == 0:
+                image = self.check_captcha()
+            elif self._status == 1:
+                image = self._fetch_captcha_image()
+            else:
+                image = None
+            if image is None:
+                self.login()
+                return
+            code, confidence = solver.solve(image)
+            if confidence < solver.min_confidence:
+                continue
+            self.set_captcha_code(code)
+            try:
+                self.login()
+                return
+            except AuthServiceError as error:
+                if str(error) != "wrong captcha code":
+                    raise
+            # 登陆失败后表单中的隐藏字段会失效，需要重新打开登陆页面。
+            self._prepare()
+        # 重新打开登陆页面，调用者可以接着手动填写验证码。
+        self._prepare()
+        raise AuthServiceError("failed to recognize the captcha")
+
+    def relogin(self) -> None:
+        """使用相同的用户名和密码重新登陆，`session` 对象保持不变。
+
+        若之前使用过自动识别验证码，则重新登陆时也会自动识别。
+        """
+        # 旧的登陆凭据必须先清除，否则即使登陆失败也会被认为登陆成功。
+        for cookie in list(self._session.cookies):
+            if cookie.name in ("CASTGC", "iPlanetDirectoryPro"):
+                self._session.cookies.clear(cookie.domain, cookie.path, cookie.name)
+        self._prepare()
+        if self._solver is not None:
+            self.login(auto_captcha=True, solver=self._solver)
+            return
+        if self.need_captcha():
+            raise AuthServiceError("must provide the captcha code")
+        self.login()
+
     def logout(self) -> None:
         """退出登陆。"""
         self._session.get(self.logout_url).raise_for_status()
 
+    def connect(self, *clients: type) -> list[Any]:
+        """登陆之后同时连接多个系统。
+
+        `clients` 是各系统的类，例如 `EStudent` 和 `ECard`。它们在各自的构造函数中
+        获取服务票据，这里并行地构造它们，并按相同的顺序返回构造好的对象。
+        需要 VPN 的系统共用一次内网检测。
+        """
+        check_network = [
+            "check_network" in inspect.signature(cls).parameters for cls in clients
+        ]
+        if any(check_network) and not test_network():
+            raise VPNError(
+                "you are not connected to the campus network, please turn on vpn"
+            )
+
+        def create(cls: type, check: bool) -> Any:
+            if check:
+                return cls(self._session, check_network=False)
+            return cls(self._session)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(clients))) as executor:
+            futures = [
+                # 在线程中沿用调用者的截止时间和请求优先级。
+                executor.submit(contextvars.copy_context().run, create, cls, check)
+                for cls, check in zip(clients, check_network)
+            ]
+            return [future.result() for future in futures]
+
+
+@dataclass
+class ReauthMetrics:
+    """会话监视器的统计信息。"""
+
+    expired: int = 0
+    reauth_succeeded: int = 0
+    reauth_failed: int = 0
+    replayed: int = 0
+    keepalive: int = 0
+    reauth_seconds: float = 0.0
+    last_reauth: datetime | None = None
+
+
+class SessionMonitor:
+    """监视 `AuthService.session` 的登陆状态。
+
+    任何被重定向到统一身份认证平台登陆页面的响应都会触发一次重新登陆，
+    幂等的请求（GET、HEAD 和 OPTIONS）会在重新登陆后重放一次。若指定了
+    `keepalive_interval`，后台线程会定期访问统一身份认证平台以保持登陆状态，
+    并在会话过期或超过 `max_age` 秒时提前重新登陆。
+
+    每次成功重新登陆之后都会以 `ReauthMetrics` 为参数调用 `on_reauth`。
+    """
+
+    idempotent_methods = frozenset({"GET", "HEAD", "OPTIONS"})
+
+    def __init__(
+        self,
+        service: AuthService,
+        keepalive_interval: float | None = 300,
+        max_age: float | None = None,
+        on_reauth: Callable[[ReauthMetrics], None] | None = None,
+    ) -> None:
+        self._service = service
+        self._session = service.session
+        self._max_age = max_age
+        self._on_reauth = on_reauth
+        self._metrics = ReauthMetrics()
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._local = threading.local()
+        self._last_login = time.monotonic()
+
+        self._request = self._session.request
+        self._session.request = self._monitored_request  # type: ignore[method-assign]
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        if keepalive_interval is not None:
+            self._thread = threading.Thread(
+                target=self._keepalive, args=(keepalive_interval,), daemon=True
+            )
+            self._thread.start()
+
+    def __enter__(self) -> "SessionMonitor":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def metrics(self) -> ReauthMetrics:
+        """统计信息的快照。"""
+        with self._metrics_lock:
+            return replace(self._metrics)
+
+    def close(self) -> None:
+        """停止监视。"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._session.request = self._request  # type: ignore[method-assign]
+
+    def reauth(self) -> None:
+        """立即重新登陆。"""
+        self._reauth(time.monotonic())
+
+    def _monitored_request(
+        self, method: str, url: str, *args, **kwargs
+    ) -> requests.Response:
+        started = time.monotonic()
+        response = self._request(method, url, *args, **kwargs)
+        if getattr(self._local, "busy", False) or not self._is_expired(url, response):
+            return response
+
+        self._count("expired")
+        self._reauth(started)
+        if method.upper() not in self.idempotent_methods:
+            return response
+        self._count("replayed")
+        return self._request(method, url, *args, **kwargs)
+
+    def _is_expired(self, url: str, response: requests.Response) -> bool:
+        # 只检查访问其它系统时被重定向到登陆页面的情况，访问统一身份认证平台本身的请求由
+        # `AuthService` 自己处理。
+        login = urlparse(AuthService.login_url)
+        if urlparse(url).hostname == login.hostname:
+            return False
+        final = urlparse(response.url)
+        if final.hostname != login.hostname or final.path != login.path:
+            return False
+        return b"auth_page_wrapper" in response.content
+
+    def _reauth(self, started: float) -> None:
+        with self._lock:
+            # 其它线程已经在这个请求发出之后成功重新登陆过了。重新登陆失败时不更新
+            # `_last_login`，等待的线程会自己再尝试一次。
+            if self._last_login > started:
+                return
+            self._local.busy = True
+            begin = time.monotonic()
+            try:
+                self._service.relogin()
+            except (AuthServiceError, requests.RequestException):
+                self._count("reauth_failed")
+                raise
+            finally:
+                self._local.busy = False
+                self._count("reauth_seconds", time.monotonic() - begin)
+            self._last_login = time.monotonic()
+            with self._metrics_lock:
+                self._metrics.reauth_succeeded += 1
+                self._metrics.last_reauth = datetime.now()
+            if self._on_reauth is not None:
+                self._on_reauth(self.metrics)
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._metrics_lock:
+            setattr(self._metrics, name, getattr(self._metrics, name) + value)
+
+    def _keepalive(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                if (
+                    self._max_age is not None
+                    and time.monotonic() - self._last_login >= self._max_age
+                ):
+                    self._reauth(time.monotonic())
+                    continue
+                started = time.monotonic()
+                response = self._request("GET", AuthService.login_url)
+                self._count("keepalive")
+                if b"auth_page_wrapper" in response.content:
+                    self._count("expired")
+                    self._reauth(started)
+            except (AuthServiceError, requests.RequestException):
+                pass
+
 
-__all__ = ("AuthService",)
+__all__ = "AuthService", "ReauthMetrics", "SessionMonitor"
@@ -0,0 +1,257 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+from suep_toolkit import deadline
+from suep_toolkit.transport import AdapterWrapper
+from suep_toolkit.transport import install as install_wrapper
+from suep_toolkit.util import CircuitOpenError, DeadlineExceeded
+
+
+class State(Enum):
+    """熔断器的状态。"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class _HostState:
+    port: int
+    state: State = State.CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    trial_running: bool = False
+
+
+class CircuitBreaker:
+    """为只能在校园网中访问的主机快速失败。
+
+    连续 `failure_threshold` 次请求失败（连接错误、超时或耗时超过 `slow_call`
+    秒）之后熔断器打开，此后访问该主机的请求会立即引发 `CircuitOpenError`。
+    请求体超过 `large_body` 字节（或长度未知）的请求的耗时主要取决于上传的带宽，
+    不适用 `slow_call` 的规则。熔断器打开期间，后台线程每隔 `probe_interval` 秒尝试连接一次主机，连接成功后
+    进入半开状态，放行一个请求：它成功则关闭熔断器，失败则重新打开。
+
+    `util.test_network()` 的检测结果也会更新熔断器的状态。
+    """
+
+    default_hosts = {
+        "10.50.2.206": 80,
+        "10.168.103.76": 80,
+        "jw.shiep.edu.cn": 443,
+        "pan.shiep.edu.cn": 443,
+    }
+
+    _shared: "CircuitBreaker | None" = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        hosts: dict[str, int] | None = None,
+        failure_threshold: int = 3,
+        slow_call: float = 15.0,
+        large_body: int = 1024 * 1024,
+        probe_interval: float = 5.0,
+        probe_timeout: float = 0.5,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.large_body = large_body
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._hosts = {
+            host: _HostState(port)
+            for host, port in (self.default_hosts if hosts is None else hosts).items()
+        }
+        self._lock = threading.Lock()
+        self._prober: threading.Thread | None = None
+
+    @classmethod
+    def shared(cls) -> "CircuitBreaker":
+        """返回进程内共享的熔断器。"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def state(self, host: str) -> State:
+        """返回某个主机的熔断器状态，不受监视的主机总是 `State.CLOSED`。"""
+        with self._lock:
+            if host not in self._hosts:
+                return State.CLOSED
+            return self._hosts[host].state
+
+    def before(self, host: str) -> None:
+        """在请求之前调用，熔断器打开时引发 `CircuitOpenError`。"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.state == State.CLOSED:
+                return
+            if state.state == State.HALF_OPEN and not state.trial_running:
+                state.trial_running = True
+                return
+        raise CircuitOpenError(f"{host} is not responding, please turn on vpn")
+
+    def record(self, host: str, ok: bool) -> None:
+        """记录一次请求或检测的结果。"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                return
+            state.trial_running = False
+            if ok:
+                state.state = State.CLOSED
+                state.failures = 0
+                return
+            state.failures += 1
+            if state.state == State.HALF_OPEN or (
+                state.failures >= self.failure_threshold
+            ):
+                state.state = State.OPEN
+                state.opened_at = time.monotonic()
+                self._start_prober()
+
+    def release(self, host: str) -> None:
+        """半开状态下放行的请求没有得出结果时调用，允许再放行一个请求。"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None:
+                state.trial_running = False
+
+    def probe(
+        self, host: str, port: int | None = None, timeout: float | None = None
+    ) -> bool:
+        """尝试与主机建立 TCP 连接，并用结果更新熔断器。"""
+        if port is None:
+            port = self._hosts[host].port if host in self._hosts else 80
+        try:
+            socket.create_connection(
+                (host, port), timeout=deadline.timeout(timeout or self.probe_timeout)
+            ).close()
+        except OSError:
+            ok = False
+        else:
+            ok = True
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                return ok
+            if ok:
+                # 主机重新可以连接，先放行一个请求试探服务是否恢复。连接成功并不说明
+                # 服务正常，因此不清除熔断器关闭时的失败计数。
+                if state.state == State.OPEN:
+                    state.state = State.HALF_OPEN
+                return ok
+        self.record(host, False)
+        return ok
+
+    def _start_prober(self) -> None:
+        # 调用时已经持有 self._lock。
+        if self._prober is not None and self._prober.is_alive():
+            return
+        self._prober = threading.Thread(target=self._probe_loop, daemon=True)
+        self._prober.start()
+
+    def _probe_loop(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                hosts = [
+                    host
+                    for host, state in self._hosts.items()
+                    if state.state == State.OPEN
+                ]
+                if len(hosts) == 0:
+                    self._prober = None
+                    return
+            for host in hosts:
+                self.probe(host)
+
+
+class CircuitBreakerAdapter(AdapterWrapper):
+    """让请求经过熔断器。
+
+    没有指定超时时间的请求会使用 `default_timeout`，避免在断开的连接上无限等待。
+    请求的耗时从这个适配器发出请求时算起，因此应当安装在限流之内。
+    """
+
+    default_timeout = (3.05, 60)
+
+    def __init__(
+        self, adapter: BaseAdapter, breaker: CircuitBreaker | None = None
+    ) -> None:
+        super().__init__(adapter)
+        self.breaker = breaker or CircuitBreaker.shared()
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        host = urlsplit(request.url).hostname or ""
+        self.breaker.before(host)
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        start = time.monotonic()
+        try:
+            response = self.adapter.send(request, **kwargs)
+        except DeadlineExceeded:
+            # 超时是因为调用者的截止时间，不能说明主机有问题。
+            self.breaker.release(host)
+            raise
+        except (requests.ConnectionError, requests.Timeout):
+            self.breaker.record(host, False)
+            raise
+        except BaseException:
+            # 其它异常同样不能说明主机的状况，但必须放开半开状态下的试探请求，
+            # 否则这个主机会一直被阻止。
+            self.breaker.release(host)
+            raise
+        slow = time.monotonic() - start >= self.breaker.slow_call and not self._uploads(
+            request
+        )
+        self.breaker.record(host, not slow)
+        return response
+
+    def _uploads(self, request: requests.PreparedRequest) -> bool:
+        if request.body is None:
+            return False
+        length = request.headers.get("Content-Length")
+        if length is None:
+            # 分块传输的请求体长度未知。
+            return True
+        return int(length) > self.breaker.large_body
+
+
+def install(session: requests.Session, breaker: CircuitBreaker | None = None) -> None:
+    """让会话的所有请求经过熔断器，默认使用进程内共享的熔断器。"""
+    install_wrapper(session, lambda adapter: CircuitBreakerAdapter(adapter, breaker))
+
+
+__all__ = "State", "CircuitBreaker", "CircuitBreakerAdapter", "install"
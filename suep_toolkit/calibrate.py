@@ -0,0 +1,235 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import copy
+import math
+import re
+import socket
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Iterable
+
+import requests
+
+from suep_toolkit import deadline
+from suep_toolkit.course import CourseManagement
+from suep_toolkit.ratelimit import RateLimiter
+
+
+@dataclass
+class ElectionConfig:
+    """根据测量结果推荐的选课参数。
+
+    `connections` 是使用的连接数，`in_flight` 是同时发出的选课请求数，
+    `retry_interval` 是同一个连接上两次请求之间的间隔（秒），`lead_time` 是
+    需要提前多少秒发出请求才能在选课开始时到达服务器（已经考虑了时钟偏差）。
+    """
+
+    connections: int
+    in_flight: int
+    retry_interval: float
+    lead_time: float
+
+    def send_time(self, start: datetime) -> datetime:
+        """为了在服务器时间 `start` 到达服务器，应当在本机的什么时间发出请求。"""
+        return start - timedelta(seconds=self.lead_time)
+
+
+@dataclass
+class CalibrationReport:
+    """测量结果。时间的单位均为秒。
+
+    `clock_offset` 是服务器时钟减去本机时钟，`throttle_interval` 是没有触发
+    服务器限流的最短请求间隔，测量中一直没有触发限流时为 `None`。
+    """
+
+    rtt: list[float] = field(default_factory=list)
+    server_time: list[float] = field(default_factory=list)
+    clock_offset: float = 0.0
+    clock_uncertainty: float = math.inf
+    throttle_interval: float | None = None
+    config: ElectionConfig | None = None
+
+    def histogram(self, bins: int = 10, width: int = 40) -> str:
+        """往返时间和服务器处理时间的直方图（以毫秒为单位）。"""
+        return "\n\n".join(
+            [
+                "RTT (ms)\n" + _histogram(self.rtt, bins, width),
+                "server time (ms)\n" + _histogram(self.server_time, bins, width),
+            ]
+        )
+
+
+def _histogram(samples: Iterable[float], bins: int, width: int) -> str:
+    values = [sample * 1000 for sample in samples]
+    if len(values) == 0:
+        return "(no samples)"
+    low, high = min(values), max(values)
+    step = (high - low) / bins or 1.0
+    counts = [0] * bins
+    for value in values:
+        counts[min(int((value - low) / step), bins - 1)] += 1
+    peak = max(counts)
+    lines = []
+    for i, count in enumerate(counts):
+        bar = "#" * round(count / peak * width)
+        lines.append(
+            f"{low + i * step:8.1f} - {low + (i + 1) * step:8.1f} | {bar} {count}"
+        )
+    return "\n".join(lines)
+
+
+class ElectionCalibrator:
+    """在选课开始前测量到教务系统的网络状况，并给出推荐的选课参数。
+
+    只发送读取数据的请求（选课首页和课程数据），不会选课或退课。测量使用一个
+    单独的、没有限流的会话，以便得到真实的网络状况。
+
+    探测限流阈值需要用同一个账号不断加快请求直到被服务器限流，可能连累正式选课时
+    的会话，因此默认不探测。需要时应当在选课开始之前很久（例如前一天）单独运行，
+    切勿在即将开始选课时探测。不探测时重试间隔使用 `RateLimiter` 对教务系统的默认
+    限额。
+    """
+
+    host = "jw.shiep.edu.cn"
+    throttle_intervals = (1.0, 0.5, 0.3, 0.2, 0.1, 0.05)
+    throttle_messages = ("过快点击", "请不要过快", "频繁")
+
+    def __init__(self, course_management: CourseManagement, samples: int = 20) -> None:
+        self.samples = samples
+        self._session = requests.Session()
+        source = course_management._session
+        self._session.headers.update(source.headers)
+        self._session.cookies.update(copy.deepcopy(source.cookies))
+
+    def run(self, throttle: bool = False) -> CalibrationReport:
+        """进行测量。`throttle` 为真时还会探测服务器的限流阈值。"""
+        report = CalibrationReport()
+        urls = [CourseManagement.elect_course1_url]
+        response = self._get(CourseManagement.elect_course1_url)
+        profile = re.search(r"electionProfile.id=(\d+)", response.text)
+        if profile is not None:
+            # 课程数据只有在打开选课页面之后才能读取，在选课开始前读取不到也没有关系。
+            self._get(
+                f"{CourseManagement.elect_course2_url}"
+                f"?electionProfile.id={profile.group(1)}"
+            )
+            urls.append(
+                f"{CourseManagement.course_data_url}?profileId={profile.group(1)}"
+            )
+
+        report.rtt = [self._connect_time() for _ in range(self.samples)]
+        rtt = statistics.median(report.rtt)
+        clock_samples = []
+        for i in range(self.samples):
+            # 让请求均匀地分布在一秒中的不同位置，才能从精度为一秒的 Date 头中
+            # 估计出更精确的时钟偏差。
+            now = time.time()
+            time.sleep((math.floor(now) + 1 + i / self.samples - now) % 1)
+            start = time.time()
+            response = self._get(urls[i % len(urls)])
+            end = time.time()
+            report.server_time.append(max(0.0, response.elapsed.total_seconds() - rtt))
+            if "Date" in response.headers:
+                server = parsedate_to_datetime(response.headers["Date"]).timestamp()
+                clock_samples.append((start, end, server))
+        report.clock_offset, report.clock_uncertainty = self._clock_offset(
+            clock_samples
+        )
+        if throttle:
+            report.throttle_interval = self._throttle_interval(urls[0])
+        report.config = self._recommend(report)
+        return report
+
+    def _get(self, url: str) -> requests.Response:
+        response = self._session.get(url, verify=False, timeout=deadline.timeout(10))
+        response.raise_for_status()
+        return response
+
+    def _connect_time(self) -> float:
+        start = time.perf_counter()
+        socket.create_connection((self.host, 443), timeout=deadline.timeout(5)).close()
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _clock_offset(samples: list[tuple[float, float, float]]) -> tuple[float, float]:
+        # 服务器在本机时间 [start, end] 中的某一刻生成了 Date 头，此时服务器的时间在
+        # [server, server + 1) 中，因此偏差在 [server - end, server + 1 - start] 中。
+        # 所有样本给出的区间的交集就是偏差的范围。
+        if len(samples) == 0:
+            return 0.0, math.inf
+        low = max(server - end for start, end, server in samples)
+        high = min(server + 1 - start for start, end, server in samples)
+        if low > high:
+            # 服务器的时钟在测量期间发生了跳变，退而使用各个样本的中位数。
+            offsets = [
+                server + 0.5 - (start + end) / 2 for start, end, server in samples
+            ]
+            return statistics.median(offsets), 0.5
+        return (low + high) / 2, (high - low) / 2
+
+    def _throttle_interval(self, url: str) -> float | None:
+        # 逐渐缩短请求间隔，服务器第一次返回限流的提示时立即停止，不再发送请求。
+        passed = None
+        for interval in self.throttle_intervals:
+            for _ in range(5):
+                start = time.monotonic()
+                try:
+                    response = self._session.get(
+                        url, verify=False, timeout=deadline.timeout(10)
+                    )
+                except requests.RequestException:
+                    return interval * 2 if passed is None else passed
+                if response.status_code != 200 or any(
+                    message in response.text for message in self.throttle_messages
+                ):
+                    return interval * 2 if passed is None else passed
+                time.sleep(max(0.0, interval - (time.monotonic() - start)))
+            passed = interval
+        return None
+
+    @staticmethod
+    def _recommend(report: CalibrationReport) -> ElectionConfig:
+        rtt = statistics.median(report.rtt)
+        server_time = statistics.median(report.server_time) if report.server_time else 0
+        latency = rtt + server_time
+        if report.throttle_interval is None:
+            rate, _ = RateLimiter.default_limits[ElectionCalibrator.host]
+            retry_interval = 1 / rate
+        else:
+            # 留出两成的余量，避免因为网络抖动而触发限流。
+            retry_interval = report.throttle_interval * 1.2
+        # 要在每个间隔内都有一个请求到达服务器，同时发出的请求数至少是
+        # 一个请求的耗时与间隔之比。
+        in_flight = min(8, max(1, math.ceil(latency / retry_interval)))
+        return ElectionConfig(
+            connections=in_flight,
+            in_flight=in_flight,
+            retry_interval=round(retry_interval, 3),
+            lead_time=round(rtt / 2 + report.clock_offset, 3),
+        )
+
+
+__all__ = "ElectionConfig", "CalibrationReport", "ElectionCalibrator"
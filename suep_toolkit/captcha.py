@@ -0,0 +1,288 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""识别统一身份认证平台的验证码。
+
+此模块需要 numpy 和 Pillow，可以通过 `pip install suep_toolkit[captcha]` 安装。
+"""
+
+import io
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import requests
+
+from suep_toolkit import user_agent
+from suep_toolkit.util import cache_dir
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError as error:
+    raise ImportError(
+        "the captcha solver requires numpy and pillow, "
+        "install them with 'pip install suep_toolkit[captcha]'"
+    ) from error
+
+
+@dataclass
+class BenchmarkResult:
+    """验证码识别的准确率和耗时。"""
+
+    samples: int
+    accuracy: float
+    char_accuracy: float
+    mean_ms: float
+    p95_ms: float
+
+
+class CaptchaSolver:
+    """基于字符分割和 softmax 分类器的验证码识别器。
+
+    验证码先被二值化，再按列投影切分成单个字符，每个字符缩放到固定大小后
+    交给一个线性分类器。整个过程只需要 CPU，单张图片的耗时在毫秒级。
+    """
+
+    glyph_size = 16
+    default_model = "captcha-model.npz"
+
+    def __init__(self, length: int = 4, min_confidence: float = 0.5) -> None:
+        self.length = length
+        self.min_confidence = min_confidence
+        self._alphabet = ""
+        self._weights: np.ndarray | None = None
+        self._bias: np.ndarray | None = None
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> "CaptchaSolver":
+        """读取训练好的模型，默认从缓存目录中读取。"""
+        data = np.load(path or cache_dir() / cls.default_model)
+        solver = cls(int(data["length"]), float(data["min_confidence"]))
+        solver._alphabet = str(data["alphabet"])
+        solver._weights = data["weights"]
+        solver._bias = data["bias"]
+        return solver
+
+    def save(self, path: Path | None = None) -> None:
+        """保存模型，默认保存到缓存目录中。"""
+        if self._weights is None:
+            raise ValueError("the solver has not been trained")
+        with open(path or cache_dir() / self.default_model, "wb") as file:
+            np.savez(
+                file,
+                length=self.length,
+                min_confidence=self.min_confidence,
+                alphabet=self._alphabet,
+                weights=self._weights,
+                bias=self._bias,
+            )
+
+    def train(
+        self,
+        samples: Iterable[tuple[bytes, str]],
+        epochs: int = 300,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+    ) -> None:
+        """用标注好的样本训练分类器。
+
+        每个样本是一个 `(jpeg 图像, 验证码)` 元组。无法切分成 `length` 个字符的
+        样本会被忽略。
+        """
+        features, labels = [], []
+        for image, code in samples:
+            if len(code) != self.length:
+                continue
+            glyphs = self._segment(image)
+            if glyphs is None:
+                continue
+            features.append(glyphs)
+            labels.extend(code)
+        if len(features) == 0:
+            raise ValueError("no usable samples")
+
+        x = np.concatenate(features)
+        self._alphabet = "".join(sorted(set(labels)))
+        index = {char: i for i, char in enumerate(self._alphabet)}
+        y = np.zeros((len(labels), len(self._alphabet)))
+        y[np.arange(len(labels)), [index[char] for char in labels]] = 1
+
+        rng = np.random.default_rng(0)
+        self._weights = rng.normal(0, 0.01, (x.shape[1], len(self._alphabet)))
+        self._bias = np.zeros(len(self._alphabet))
+        for _ in range(epochs):
+            probability = self._softmax(x @ self._weights + self._bias)
+            gradient = (probability - y) / len(x)
+            self._weights -= learning_rate * (x.T @ gradient + l2 * self._weights)
+            self._bias -= learning_rate * gradient.sum(axis=0)
+
+    def solve(self, image: bytes) -> tuple[str, float]:
+        """识别验证码，返回识别结果和置信度。
+
+        置信度是各个字符概率的乘积，无法切分时返回空字符串和 `0.0`。
+        """
+        if self._weights is None:
+            raise ValueError("the solver has not been trained")
+        glyphs = self._segment(image)
+        if glyphs is None:
+            return "", 0.0
+        probability = self._softmax(glyphs @ self._weights + self._bias)
+        best = probability.argmax(axis=1)
+        code = "".join(self._alphabet[i] for i in best)
+        return code, float(probability[np.arange(len(best)), best].prod())
+
+    def benchmark(self, samples: Iterable[tuple[bytes, str]]) -> BenchmarkResult:
+        """在标注好的样本（应当是没有参与训练的样本）上测试准确率和耗时。"""
+        correct = correct_chars = total = 0
+        latency = []
+        for image, code in samples:
+            start = time.perf_counter()
+            result, _ = self.solve(image)
+            latency.append((time.perf_counter() - start) * 1000)
+            total += 1
+            correct += result == code
+            correct_chars += sum(a == b for a, b in zip(result, code))
+        if total == 0:
+            raise ValueError("no samples")
+        return BenchmarkResult(
+            total,
+            correct / total,
+            correct_chars / (total * self.length),
+            float(np.mean(latency)),
+            float(np.percentile(latency, 95)),
+        )
+
+    def _segment(self, image: bytes) -> "np.ndarray | None":
+        gray = np.asarray(Image.open(io.BytesIO(image)).convert("L"), dtype=np.uint8)
+        mask = gray < self._otsu_threshold(gray)
+        columns = np.flatnonzero(mask.sum(axis=0) > 0)
+        if len(columns) == 0:
+            return None
+
+        # 连续的非空列组成一段，段数不足时不断把最宽的一段从中间切开。
+        breaks = np.flatnonzero(np.diff(columns) > 1)
+        spans = [
+            [int(start), int(end) + 1]
+            for start, end in zip(
+                np.concatenate(([columns[0]], columns[breaks + 1])),
+                np.concatenate((columns[breaks], [columns[-1]])),
+            )
+        ]
+        # 去掉噪点造成的过窄的段。
+        spans = [span for span in spans if span[1] - span[0] > 1] or spans
+        while len(spans) > self.length:
+            # 把最窄的一段与离它更近的相邻段合并。
+            i = min(range(len(spans)), key=lambda i: spans[i][1] - spans[i][0])
+            if i == 0:
+                j = 1
+            elif i == len(spans) - 1:
+                j = i - 1
+            elif spans[i][0] - spans[i - 1][1] <= spans[i + 1][0] - spans[i][1]:
+                j = i - 1
+            else:
+                j = i + 1
+            low, high = min(i, j), max(i, j)
+            spans[low : high + 1] = [[spans[low][0], spans[high][1]]]
+        while len(spans) < self.length:
+            i = max(range(len(spans)), key=lambda i: spans[i][1] - spans[i][0])
+            start, end = spans[i]
+            if end - start < 2:
+                return None
+            middle = (start + end) // 2
+            spans[i : i + 1] = [[start, middle], [middle, end]]
+
+        glyphs = np.empty((self.length, self.glyph_size * self.glyph_size))
+        for i, (start, end) in enumerate(spans):
+            glyph = mask[:, start:end]
+            rows = np.flatnonzero(glyph.any(axis=1))
+            # 从合并过的段中间切开时，一半可能只包含原来的空白列。
+            if len(rows) == 0:
+                return None
+            glyph = glyph[rows[0] : rows[-1] + 1]
+            resized = Image.fromarray(glyph.astype(np.uint8) * 255).resize(
+                (self.glyph_size, self.glyph_size), Image.BILINEAR
+            )
+            glyphs[i] = np.asarray(resized, dtype=np.float64).ravel() / 255
+        return glyphs
+
+    @staticmethod
+    def _otsu_threshold(gray: np.ndarray) -> int:
+        histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        weight = np.cumsum(histogram)
+        mean = np.cumsum(histogram * np.arange(256))
+        total_weight, total_mean = weight[-1], mean[-1]
+        background = weight[:-1]
+        foreground = total_weight - background
+        valid = (background > 0) & (foreground > 0)
+        variance = np.zeros(255)
+        variance[valid] = (
+            total_mean * background[valid] / total_weight - mean[:-1][valid]
+        ) ** 2 / (background[valid] * foreground[valid])
+        return int(variance.argmax()) + 1
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def load_samples(directory: Path) -> list[tuple[bytes, str]]:
+    """读取标注好的样本。
+
+    样本文件名（去掉扩展名和 `_` 之后的部分）就是验证码，例如 `a3k9.jpg` 或
+    `a3k9_2.jpg`。
+    """
+    return [
+        (path.read_bytes(), path.stem.split("_")[0])
+        for path in sorted(Path(directory).glob("*.jpg"))
+        if not path.stem.startswith("unlabelled")
+    ]
+
+
+def collect_samples(directory: Path, count: int) -> list[Path]:
+    """从统一身份认证平台下载 `count` 张验证码，供人工标注后训练使用。
+
+    下载的文件名以 `unlabelled` 开头，标注时把文件重命名为验证码即可。
+    """
+    from suep_toolkit.auth import AuthService
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    session = requests.Session()
+    session.headers["User-Agent"] = user_agent
+    session.get(AuthService.login_url).raise_for_status()
+    paths = []
+    for i in range(count):
+        response = session.get(
+            AuthService.captcha_image_url, params={"ts": time.time_ns() // 10**6}
+        )
+        response.raise_for_status()
+        path = directory / f"unlabelled_{i}.jpg"
+        path.write_bytes(response.content)
+        paths.append(path)
+    return paths
+
+
+__all__ = "BenchmarkResult", "CaptchaSolver", "load_samples", "collect_samples"
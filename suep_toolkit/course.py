@@ -22,12 +22,16 @@
 
 import json
 import re
-import socket
-from typing import Iterable
+from dataclasses import dataclass
+from typing import Any, Iterable
 
 import requests
 from bs4 import BeautifulSoup
 
+from suep_toolkit.breaker import CircuitBreaker
+from suep_toolkit.memo import parse_cache
+from suep_toolkit.ratelimit import Priority, priority
+from suep_toolkit.singleflight import group
 from suep_toolkit.util import AuthServiceError, VPNError
 
 
@@ -39,6 +43,41 @@ class ElectCourseError(Exception):
         self.error = error
 
 
+# 每天最多的节数，用于把上课时间编码为位集合。
+units_per_day = 14
+
+
+def encode_time_slots(arrange_info: Iterable[dict[str, Any]]) -> int:
+    """把课程的排课信息编码为一个位集合。
+
+    `arrange_info` 是选课数据中每门课的 `arrangeInfo` 字段，其中 `weekState`
+    的第 n 个字符表示第 n 周是否上课。第 n 周星期 d 的第 u 节课对应第
+    `((n * 7) + d - 1) * units_per_day + u - 1` 位，两门课冲突当且仅当它们的
+    位集合有交集。
+    """
+    slots = 0
+    for arrange in arrange_info:
+        units = 0
+        for unit in range(int(arrange["startUnit"]), int(arrange["endUnit"]) + 1):
+            units |= 1 << (unit - 1)
+        day = int(arrange["weekDay"]) - 1
+        for week, state in enumerate(arrange["weekState"]):
+            if state == "1":
+                slots |= units << ((week * 7 + day) * units_per_day)
+    return slots
+
+
+@dataclass(frozen=True, slots=True)
+class CourseRecord:
+    """课程的信息，不包含会话，可以缓存或者在进程之间传递。"""
+
+    name: str
+    id: int
+    no: str
+    profile_id: str
+    time_slots: int = 0
+
+
 class Course:
     """一个选课类。"""
 
@@ -51,12 +90,14 @@ class Course:
         course_id: int,
         course_no: str,
         profile_id: str,
+        time_slots: int = 0,
     ) -> None:
         self._session = session
         self._name = course_name
         self._id = course_id
         self._no = course_no
         self._profile_id = profile_id
+        self._time_slots = time_slots
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(name={self._name!r}, id={self._id!r}, no={self._no!r})"
@@ -73,16 +114,48 @@ class Course:
     def no(self) -> str:
         return self._no
 
-    def elect(self) -> None:
-        response = self._session.post(
-            self.operator_url,
-            params={"profileId": self._profile_id},
-            data={"optype": "true", "operator0": f"{self._id}:true:0"},
-            verify=False,
+    @property
+    def time_slots(self) -> int:
+        """上课时间的位集合，见 `encode_time_slots`。"""
+        return self._time_slots
+
+    @property
+    def record(self) -> CourseRecord:
+        """课程的信息。"""
+        return CourseRecord(
+            self._name, self._id, self._no, self._profile_id, self._time_slots
+        )
+
+    @classmethod
+    def from_record(cls, session: requests.Session, record: CourseRecord) -> "Course":
+        """用课程的信息和已登陆的会话构造可以选课的对象。"""
+        return cls(
+            session,
+            record.name,
+            record.id,
+            record.no,
+            record.profile_id,
+            record.time_slots,
         )
+
+    def conflicts_with(self, other: "Course") -> bool:
+        """判断两门课的上课时间是否冲突。"""
+        return self._time_slots & other._time_slots != 0
+
+    def elect(self) -> None:
+        # 选课请求优先于其它请求发出。
+        with priority(Priority.HIGH):
+            response = self._session.post(
+                self.operator_url,
+                params={"profileId": self._profile_id},
+                data={"optype": "true", "operator0": f"{self._id}:true:0"},
+                verify=False,
+            )
         response.raise_for_status()
 
         dom = BeautifulSoup(response.text, features="html.parser")
+        if len(dom.select("div[class=auth_page_wrapper]")) > 0:
+            raise AuthServiceError("must login first")
         try:
             result = dom.select("table>tr>td>div")[0].text.strip()
         except:
@@ -91,15 +164,19 @@ class Course:
             raise ElectCourseError(result)
 
     def cancel(self) -> None:
-        response = self._session.post(
-            self.operator_url,
-            params={"profileId": self._profile_id},
-            data={"optype": "false", "operator0": f"{self._id}:false"},
-            verify=False,
-        )
+        # 选课请求优先于其它请求发出。
+        with priority(Priority.HIGH):
+            response = self._session.post(
+                self.operator_url,
+                params={"profileId": self._profile_id},
+                data={"optype": "false", "operator0": f"{self._id}:false"},
+                verify=False,
+            )
         response.raise_for_status()
 
         dom = BeautifulSoup(response.text, features="html.parser")
+        if len(dom.select("div[class=auth_page_wrapper]")) > 0:
+            raise AuthServiceError("must login first")
         try:
             result = dom.select("table>tr>td>div")[0].text.strip()
         except:
@@ -123,12 +200,10 @@ class CourseManagement:
     def __init__(self, session: requests.Session) -> None:
         self._session = session
         self._course_list: list[Course] = []
-        try:
-            socket.create_connection(("jw.shiep.edu.cn", 443), timeout=0.5)
-        except TimeoutError as error:
+        if not CircuitBreaker.shared().probe("jw.shiep.edu.cn", 443):
             raise VPNError(
                 "you are not connected to the campus network, please turn on vpn"
-            ) from error
+            )
         response = self._session.get(self.login_url, verify=False)
         response.raise_for_status()
         dom = BeautifulSoup(response.text, features="html.parser")
@@ -138,7 +213,8 @@ class CourseManagement:
 
         self._session.get(self.course_table1_url, verify=False).raise_for_status()
 
-    def _get_course_list(self) -> None:
+    def _get_course_list(self) -> list[Course]:
+        course_list = []
         response = self._session.get(self.elect_course1_url, verify=False)
         response.raise_for_status()
         for profile_id in re.finditer(r"electionProfile.id=(\d+)", response.text):
@@ -155,26 +231,43 @@ class CourseManagement:
                 params={"profileId": profile_id.group(1)},
                 verify=False,
             )
-            legal_json_str = re.sub(
-                r"(,|{)(\w+):", r'\1"\2":', response.text[18:-1]
-            ).replace("'", '"')
-            legal_json = json.loads(legal_json_str)
-            for course in legal_json:
-                self._course_list.append(
-                    Course(
-                        self._session,
-                        course["name"],
-                        course["id"],
-                        course["no"],
-                        profile_id.group(1),
-                    )
+            for name, id, no, time_slots in parse_cache.parse(
+                response, self._parse_course_data
+            ):
+                course_list.append(
+                    Course(self._session, name, id, no, profile_id.group(1), time_slots)
                 )
+        return course_list
+
+    @staticmethod
+    def _parse_course_data(text: str) -> tuple[tuple[str, int, str, int], ...]:
+        legal_json_str = re.sub(r"(,|{)(\w+):", r'\1"\2":', text[18:-1]).replace(
+            "'", '"'
+        )
+        return tuple(
+            (
+                course["name"],
+                course["id"],
+                course["no"],
+                encode_time_slots(course.get("arrangeInfo", [])),
+            )
+            for course in json.loads(legal_json_str)
+        )
 
     @property
     def electable_course(self) -> Iterable[Course]:
         if len(self._course_list) == 0:
-            self._get_course_list()
+            # 同一个会话同时获取课程列表时只请求一次。
+            self._course_list = group.do(
+                (self._session, self.course_data_url), self._get_course_list
+            )
         yield from self._course_list
 
 
-__all__ = ("CourseManagement",)
+__all__ = (
+    "ElectCourseError",
+    "CourseRecord",
+    "Course",
+    "CourseManagement",
+    "encode_time_slots",
+)
@@ -0,0 +1,232 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Iterable
+
+import requests
+
+from suep_toolkit.ehall.ecard import ECard
+from suep_toolkit.electricity import ElectricityManagement
+from suep_toolkit.estudent import EStudent
+from suep_toolkit.semester import SemesterCalendar
+from suep_toolkit.util import AuthServiceError, VPNError, test_network
+
+
+@dataclass
+class FieldResult:
+    """快照中的一项数据。
+
+    获取失败时 `value` 为 `None`，异常保存在 `error` 中。`cached` 表示这项数据
+    来自之前的快照。
+    """
+
+    value: Any = None
+    error: BaseException | None = None
+    elapsed: float = 0.0
+    fetched_at: float = 0.0
+    cached: bool = False
+
+
+@dataclass
+class Snapshot:
+    """各系统数据的快照。"""
+
+    fields: dict[str, FieldResult] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def __getitem__(self, name: str) -> Any:
+        """返回某项数据的值，获取失败时引发对应的异常。"""
+        result = self.fields[name]
+        if result.error is not None:
+            raise result.error
+        return result.value
+
+    @property
+    def errors(self) -> dict[str, BaseException]:
+        return {
+            name: result.error
+            for name, result in self.fields.items()
+            if result.error is not None
+        }
+
+
+class Dashboard:
+    """同时获取一卡通、电表、住宿和教学周等数据。
+
+    所有请求共用同一个已登陆的会话并同时发出，各系统的客户端只会建立一次。
+    每项数据在 `max_age` 规定的时间内会直接使用上一次的结果。
+    """
+
+    default_max_age = {
+        "card_status": 60,
+        "today_transaction": 60,
+        "meter_state": 300,
+        "accommodation": 24 * 3600,
+        "semester_week": 3600,
+    }
+
+    def __init__(
+        self,
+        session: requests.Session,
+        max_age: dict[str, float] | None = None,
+        max_workers: int = 8,
+    ) -> None:
+        self._session = session
+        self._max_age = dict(self.default_max_age)
+        if max_age is not None:
+            self._max_age.update(max_age)
+        self._fetchers: dict[str, Callable[[], Any]] = {
+            "card_status": lambda: self._client(ECard).status,
+            "today_transaction": lambda: list(
+                self._client(ECard).get_transaction(date.today())
+            ),
+            "meter_state": lambda: self._client(ElectricityManagement).meter_state,
+            "accommodation": lambda: list(self._client(EStudent).accommodation_record),
+            "semester_week": lambda: SemesterCalendar.default().week(),
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # 已经完成的任务会在 `add_done_callback` 中立即回调，因此需要可重入锁。
+        self._lock = threading.RLock()
+        self._cache: dict[str, FieldResult] = {}
+        self._running: dict[str, Future] = {}
+        self._clients: dict[type, Any] = {}
+        self._client_locks = {
+            cls: threading.Lock() for cls in (ECard, ElectricityManagement, EStudent)
+        }
+        self._network_lock = threading.Lock()
+        self._network: bool | None = None
+
+    def __enter__(self) -> "Dashboard":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(
+        self, deadline: float = 10, fields: Iterable[str] | None = None
+    ) -> Snapshot:
+        """获取快照，最多等待 `deadline` 秒。
+
+        超时或出错的数据项会带有对应的异常，其余数据项不受影响。超时的请求会在后台
+        继续执行，结果可供下一次快照使用。
+        """
+        start = time.monotonic()
+        names = list(fields or self._fetchers)
+        snapshot = Snapshot()
+        futures: dict[str, Future] = {}
+        with self._network_lock:
+            self._network = None
+        with self._lock:
+            for name in names:
+                cached = self._cache.get(name)
+                if (
+                    cached is not None
+                    and time.time() - cached.fetched_at < self._max_age.get(name, 0)
+                ):
+                    snapshot.fields[name] = FieldResult(
+                        cached.value, None, 0.0, cached.fetched_at, True
+                    )
+                elif name in self._running:
+                    futures[name] = self._running[name]
+                else:
+                    future = self._executor.submit(self._fetch, name)
+                    self._running[name] = future
+                    future.add_done_callback(
+                        lambda future, name=name: self._finish(name, future)
+                    )
+                    futures[name] = future
+
+        wait(futures.values(), timeout=max(0, deadline - (time.monotonic() - start)))
+        for name, future in futures.items():
+            if future.done():
+                snapshot.fields[name] = future.result()
+            else:
+                snapshot.fields[name] = FieldResult(
+                    error=TimeoutError("deadline exceeded"),
+                    elapsed=time.monotonic() - start,
+                )
+        snapshot.elapsed = time.monotonic() - start
+        return snapshot
+
+    def _fetch(self, name: str) -> FieldResult:
+        start = time.monotonic()
+        try:
+            value = self._fetchers[name]()
+        except AuthServiceError as error:
+            # 会话已经失效，下一次快照重新建立各系统的客户端。
+            self._discard_clients()
+            return FieldResult(error=error, elapsed=time.monotonic() - start)
+        except Exception as error:
+            return FieldResult(error=error, elapsed=time.monotonic() - start)
+        return FieldResult(value, None, time.monotonic() - start, time.time())
+
+    def _finish(self, name: str, future: Future) -> None:
+        with self._lock:
+            self._running.pop(name, None)
+            if (
+                not future.cancelled()
+                and future.exception() is None
+                and future.result().error is None
+            ):
+                self._cache[name] = future.result()
+
+    def _client(self, cls: type) -> Any:
+        with self._client_locks[cls]:
+            if cls in self._clients:
+                return self._clients[cls]
+            if cls in (ECard, ElectricityManagement):
+                # 每次快照只检测一次内网连接，而不是在每个客户端的构造函数中各检测一次。
+                with self._network_lock:
+                    if self._network is None:
+                        self._network = test_network()
+                if not self._network:
+                    raise VPNError(
+                        "you are not connected to the campus network, please turn on vpn"
+                    )
+                client = cls(self._session, check_network=False)
+            else:
+                client = cls(self._session)
+            self._clients[cls] = client
+            return client
+
+    def reset(self) -> None:
+        """丢弃已建立的客户端和缓存的数据，例如在重新登陆之后。"""
+        with self._lock:
+            self._cache.clear()
+        self._discard_clients()
+
+    def _discard_clients(self) -> None:
+        # 持有各客户端的锁，避免与正在建立同一客户端的线程交错。
+        for cls, lock in self._client_locks.items():
+            with lock:
+                self._clients.pop(cls, None)
+
+
+__all__ = "FieldResult", "Snapshot", "Dashboard"
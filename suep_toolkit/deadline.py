@@ -0,0 +1,297 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import contextvars
+import math
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import requests
+from requests.adapters import BaseAdapter
+
+from suep_toolkit.transport import AdapterWrapper
+from suep_toolkit.transport import install as install_wrapper
+from suep_toolkit.util import DeadlineExceeded
+
+
+class Deadline:
+    """一次调用的截止时间，也可以在其它线程中取消。
+
+    嵌套的截止时间不会晚于外层的截止时间，外层被取消时内层也被取消。
+    """
+
+    def __init__(self, seconds: float | None, parent: "Deadline | None" = None) -> None:
+        self.parent = parent
+        self.expires_at = math.inf if seconds is None else time.monotonic() + seconds
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._watchers: set[Callable[[], None]] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        return self.parent is not None and self.parent.cancelled
+
+    def cancel(self) -> None:
+        """取消，正在进行和此后发出的请求都会引发 `DeadlineExceeded`。"""
+        self._cancelled.set()
+        with self._lock:
+            watchers = list(self._watchers)
+        for watcher in watchers:
+            watcher()
+
+    def watch(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """在此截止时间或外层的截止时间被取消时调用 `callback`。
+
+        返回一个函数，调用它可以取消注册。
+        """
+        chain = []
+        limit: Deadline | None = self
+        while limit is not None:
+            with limit._lock:
+                limit._watchers.add(callback)
+            chain.append(limit)
+            limit = limit.parent
+
+        def unwatch() -> None:
+            for limit in chain:
+                with limit._lock:
+                    limit._watchers.discard(callback)
+
+        if self.cancelled:
+            callback()
+        return unwatch
+
+    def remaining(self) -> float:
+        """剩余的秒数，没有截止时间时为无穷大。"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self) -> None:
+        """已经取消或超时时引发 `DeadlineExceeded`。"""
+        if self.cancelled:
+            raise DeadlineExceeded("cancelled")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded("deadline exceeded")
+
+    def timeout(self, timeout: float | None = None) -> float | None:
+        """返回不超过剩余时间的超时时间，`timeout` 为 `None` 时只受剩余时间限制。"""
+        self.check()
+        remaining = self.remaining()
+        if math.isinf(remaining):
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+_current: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+def current() -> Deadline | None:
+    """返回当前的截止时间。"""
+    return _current.get()
+
+
+@contextmanager
+def deadline(seconds: float | None = None) -> Iterator[Deadline]:
+    """在 `with` 语句块中的所有请求都必须在 `seconds` 秒内完成。
+
+    超时或被取消时引发 `util.DeadlineExceeded`，它是 `TimeoutError` 的子类：
+
+    ```python
+    with deadline(5) as limit:
+        # 在其它线程中调用 limit.cancel() 可以提前中止
+        my_card.status
+    ```
+    """
+    token = _current.set(Deadline(seconds, _current.get()))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def share(parts: int) -> Iterator[None]:
+    """把剩余时间平均分成 `parts` 份，`with` 语句块只能使用其中一份。
+
+    用于由多个步骤组成的流程，避免某一步用完所有的时间。没有截止时间时不起作用。
+    """
+    parent = _current.get()
+    if parent is None or math.isinf(parent.remaining()):
+        yield
+        return
+    with deadline(parent.remaining() / parts):
+        yield
+
+
+def check() -> None:
+    """已经取消或超时时引发 `DeadlineExceeded`，没有截止时间时不起作用。"""
+    limit = _current.get()
+    if limit is not None:
+        limit.check()
+
+
+def timeout(default: float | None = None) -> float | None:
+    """返回不超过剩余时间的超时时间，没有截止时间时返回 `default`。"""
+    limit = _current.get()
+    return default if limit is None else limit.timeout(default)
+
+
+class _Flight:
+    """在另一个线程中发送的请求。调用者放弃等待时中止正在读取的响应。"""
+
+    def __init__(self, send: Callable[[], requests.Response], stream: bool) -> None:
+        # finished 在请求完成时设置，wake 还会在截止时间被取消时设置。
+        self.finished = threading.Event()
+        self.wake = threading.Event()
+        self.response: requests.Response | None = None
+        self.error: BaseException | None = None
+        self._send = send
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._abandoned = False
+
+    def run(self) -> None:
+        try:
+            response = self._send()
+            with self._lock:
+                self.response = response
+                abandoned = self._abandoned
+            if not abandoned and not self._stream:
+                response.content
+        except BaseException as error:
+            self.error = error
+        finally:
+            with self._lock:
+                abandoned = self._abandoned
+            if abandoned and self.response is not None:
+                self.response.close()
+            self.finished.set()
+            self.wake.set()
+
+    def abandon(self) -> None:
+        with self._lock:
+            self._abandoned = True
+            response = self.response
+        if response is not None and not self.finished.is_set():
+            _abort(response)
+
+
+def _abort(response: requests.Response) -> None:
+    # 关闭套接字的读写可以让另一个线程中阻塞的读取立即返回。
+    sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    if sock is None:
+        # 不复用的连接在收到响应头之后就与响应分离了，只能从响应的文件对象中找到套接字。
+        fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class DeadlineAdapter(AdapterWrapper):
+    """按照当前的截止时间限制每个请求的耗时。
+
+    有截止时间时请求（包括读取响应内容）在另一个线程中进行，超时或被取消时立即
+    引发 `DeadlineExceeded` 并中止正在读取的响应，而不是等到下一个请求才发现。
+    流式响应的内容由调用者读取，被取消时其连接同样会被中止。
+    """
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        limit = _current.get()
+        if limit is None:
+            return self.adapter.send(request, **kwargs)
+        value = kwargs.get("timeout")
+        if isinstance(value, tuple):
+            kwargs["timeout"] = tuple(limit.timeout(part) for part in value)
+        else:
+            kwargs["timeout"] = limit.timeout(value)
+        stream = kwargs.get("stream", False)
+        kwargs["stream"] = True
+        flight = _Flight(lambda: self.adapter.send(request, **kwargs), stream)
+        unwatch = limit.watch(flight.wake.set)
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(flight.run,), daemon=True).start()
+        try:
+            remaining = limit.remaining()
+            flight.wake.wait(None if math.isinf(remaining) else remaining)
+        finally:
+            unwatch()
+            # 请求完成之后再检查一次，在截止时间之后才得到的响应同样作废。
+            expired = limit.cancelled or limit.remaining() <= 0
+            if expired or not flight.finished.is_set():
+                flight.abandon()
+        if not flight.finished.is_set():
+            raise DeadlineExceeded(
+                "cancelled" if limit.cancelled else "deadline exceeded"
+            )
+        if flight.error is not None:
+            if expired and isinstance(
+                flight.error, (requests.Timeout, requests.ConnectionError)
+            ):
+                # 因为截止时间而超时时引发 DeadlineExceeded，而不是普通的网络错误。
+                raise DeadlineExceeded("deadline exceeded") from flight.error
+            raise flight.error
+        assert flight.response is not None
+        if expired:
+            flight.response.close()
+            raise DeadlineExceeded(
+                "cancelled" if limit.cancelled else "deadline exceeded"
+            )
+        response = flight.response
+        if stream:
+            # 流式的响应由调用者读取，取消时同样中止，关闭响应之后不再关注。
+            unwatch = limit.watch(lambda: _abort(response))
+            close = response.close
+
+            def closing() -> None:
+                unwatch()
+                close()
+
+            response.close = closing
+        return response
+
+
+def install(session: requests.Session) -> None:
+    """让会话的请求遵守当前的截止时间。"""
+    install_wrapper(session, DeadlineAdapter)
+
+
+__all__ = (
+    "Deadline",
+    "current",
+    "deadline",
+    "share",
+    "check",
+    "timeout",
+    "DeadlineAdapter",
+    "install",
+)
@@ -20,18 +20,30 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import contextvars
+import copy
+import dataclasses
+import heapq
+import json
 import re
-from dataclasses import dataclass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import date, datetime, timedelta
-from typing import Iterable
+from queue import Full, Queue
+from typing import Any, Iterable, Iterator
+from urllib.parse import urlparse
 
 import requests
 from bs4 import BeautifulSoup
 
+from suep_toolkit import deadline, offload
+from suep_toolkit.memo import parse_cache
+from suep_toolkit.singleflight import group
 from suep_toolkit.util import AuthServiceError, VPNError, test_network
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AccountInfo:
     """校园卡账号信息。"""
 
@@ -39,7 +51,7 @@ class AccountInfo:
     name: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CardStatus:
     """校园卡状态。"""
 
@@ -48,7 +60,7 @@ class CardStatus:
     lost: bool
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CardTransaction:
     """校园卡流水。"""
 
@@ -60,6 +72,212 @@ class CardTransaction:
     comment: str
 
 
+@dataclass(frozen=True, slots=True)
+class AccountTransaction:
+    """带有账号信息的校园卡流水。"""
+
+    account: AccountInfo
+    transaction: CardTransaction
+
+
+@dataclass
+class AccountsReport:
+    """多个账号的状态和流水。
+
+    `status` 以账号 ID 为键，`transactions` 按时间从新到旧排列。
+    """
+
+    status: dict[int, CardStatus] = field(default_factory=dict)
+    transactions: list[AccountTransaction] = field(default_factory=list)
+
+
+@dataclass(frozen=True, slots=True)
+class TransactionCursor:
+    """流水查询的位置。
+
+    `segment` 是查询中的第几部分（当日流水或历史流水），`page` 是下一条流水所在
+    的页，`offset` 是这一页中已经返回的流水数，`last_key` 是最后返回的流水的键，
+    用于在页面内容发生移动时去除重复的流水。`today` 是创建查询时的日期，查询按它
+    划分为几部分，因此第二天继续查询时各部分的划分不变；`count` 是这一部分中已经
+    返回的流水数。
+    """
+
+    account: int
+    start: date
+    end: date
+    segment: int = 0
+    page: int = 1
+    offset: int = 0
+    last_key: str | None = None
+    today: date | None = None
+    count: int = 0
+
+    def dumps(self) -> str:
+        """序列化为 JSON 字符串。"""
+        data = dataclasses.asdict(self)
+        data["start"] = self.start.isoformat()
+        data["end"] = self.end.isoformat()
+        if self.today is not None:
+            data["today"] = self.today.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def loads(cls, data: str) -> "TransactionCursor":
+        """从 `dumps` 得到的字符串中恢复。"""
+        fields = json.loads(data)
+        fields["start"] = date.fromisoformat(fields["start"])
+        fields["end"] = date.fromisoformat(fields["end"])
+        if fields.get("today") is not None:
+            fields["today"] = date.fromisoformat(fields["today"])
+        return cls(**fields)
+
+
+def _transaction_key(transaction: CardTransaction) -> str:
+    return (
+        f"{transaction.time.isoformat()}|{transaction.amount}|"
+        f"{transaction.type}|{transaction.shop_name}"
+    )
+
+
+class TransactionReader:
+    """可以中断后继续的流水查询，由 `ECard.read_transaction` 创建。"""
+
+    _done = object()
+
+    def __init__(
+        self, card: "ECard", cursor: TransactionCursor, read_ahead: int
+    ) -> None:
+        self._card = card
+        self._cursor = cursor
+        self._read_ahead = read_ahead
+        self._rows: Iterator[tuple[CardTransaction, TransactionCursor]] | None = None
+
+    def __iter__(self) -> "TransactionReader":
+        return self
+
+    def __next__(self) -> CardTransaction:
+        if self._rows is None:
+            self._rows = self._read()
+        transaction, self._cursor = next(self._rows)
+        return transaction
+
+    @property
+    def cursor(self) -> TransactionCursor:
+        """已经返回的最后一条流水之后的位置。"""
+        return self._cursor
+
+    def close(self) -> None:
+        """停止查询和预读。"""
+        if self._rows is not None:
+            self._rows.close()
+
+    def _read(self) -> Iterator[tuple[CardTransaction, TransactionCursor]]:
+        cursor = self._cursor
+        account = next(
+            (info for info in self._card._account_info if info.id == cursor.account),
+            AccountInfo(cursor.account, ""),
+        )
+        today = cursor.today or date.today()
+        segments = self._card._segments(cursor.start, cursor.end, today)
+
+        def position(
+            index: int, page: int, offset: int, key: str | None, count: int
+        ) -> TransactionCursor:
+            return TransactionCursor(
+                cursor.account,
+                cursor.start,
+                cursor.end,
+                index,
+                page,
+                offset,
+                key,
+                today,
+                count,
+            )
+
+        for index in range(cursor.segment, len(segments)):
+            segment = segments[index]
+            resumed = index == cursor.segment
+            # 查询开始那天的当日流水在之后变成了历史流水，页的划分不再相同，只能从
+            # 第一页开始跳过已经返回的条数。
+            relaid = (
+                resumed
+                and segment == (today, today)
+                and today != date.today()
+                and (cursor.page, cursor.offset) != (1, 0)
+            )
+            first_page = cursor.page if resumed and not relaid else 1
+            pages = self._card._transaction_pages(segment, account, first_page)
+            if self._read_ahead > 0:
+                pages = self._prefetch(pages)
+            count = cursor.count if resumed else 0
+            to_skip = count if relaid else 0
+            last_key = cursor.last_key if resumed else None
+            for page, transactions in pages:
+                skip = 0
+                keys = [_transaction_key(item) for item in transactions]
+                if relaid and to_skip > 0:
+                    if cursor.last_key in keys[:to_skip]:
+                        skip, to_skip = keys.index(cursor.last_key) + 1, 0
+                    else:
+                        skip = min(to_skip, len(transactions))
+                        to_skip -= skip
+                elif not relaid and resumed and page == cursor.page:
+                    if cursor.last_key in keys:
+                        skip = keys.index(cursor.last_key) + 1
+                    else:
+                        skip = cursor.offset
+                for offset in range(skip, len(transactions)):
+                    last_key = keys[offset]
+                    count += 1
+                    yield transactions[offset], position(
+                        index, page, offset + 1, last_key, count
+                    )
+                # 一页读完之后从下一页继续，仍然保留最后一条流水的键用于去重。
+                self._cursor = position(index, page + 1, 0, last_key, count)
+            self._cursor = position(index + 1, 1, 0, None, 0)
+
+    def _prefetch(
+        self, pages: Iterable[tuple[int, list[CardTransaction]]]
+    ) -> Iterator[tuple[int, list[CardTransaction]]]:
+        # 在后台线程中按顺序获取后面的页，队列满时暂停，避免占用过多内存。
+        queue: Queue = Queue(maxsize=self._read_ahead)
+        stop = threading.Event()
+
+        def put(item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def produce() -> None:
+            try:
+                for item in pages:
+                    if not put(item):
+                        return
+            except BaseException as error:
+                put(error)
+            else:
+                put(self._done)
+
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(produce,), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = queue.get()
+                if item is self._done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+
 class ECard:
     """一卡通服务平台。"""
 
@@ -73,10 +291,12 @@ class ECard:
     history_transaction3_url = "http://10.168.103.76/accounthisTrjn3.action"
     history_transaction_list_url = "http://10.168.103.76/accountconsubBrows.action"
 
-    def __init__(self, session: requests.Session) -> None:
+    def __init__(
+        self, session: requests.Session, *, check_network: bool = True
+    ) -> None:
         self._session = session
         self._account_info: list[AccountInfo] = []
-        if not test_network():
+        if check_network and not test_network():
             raise VPNError(
                 "you are not connected to the campus network, please turn on vpn"
             )
@@ -101,22 +321,36 @@ class ECard:
 
         response = self._session.get(self.account_select_url)
         response.raise_for_status()
-        dom = BeautifulSoup(response.text, features="html.parser")
+        for account in parse_cache.parse(response, self._parse_account):
+            self._account_info.append(account)
+            yield account
 
+    @staticmethod
+    def _parse_account(html: str) -> tuple[AccountInfo, ...]:
+        dom = BeautifulSoup(html, features="html.parser")
+        accounts = []
         for element in dom.select("select#account>option"):
             account_id = int(element.attrs["value"])
             account_name = element.text.strip()
             account_name = account_name[account_name.find("---") + 3 :]
-            account = AccountInfo(account_id, account_name)
-            self._account_info.append(account)
-            yield account
+            accounts.append(AccountInfo(account_id, account_name))
+        return tuple(accounts)
 
     @property
     def status(self) -> CardStatus:
         """获取校园卡状态。"""
-        response = self._session.get(self.card_status_url)
-        response.raise_for_status()
-        dom = BeautifulSoup(response.text, features="html.parser")
+
+        def fetch() -> CardStatus:
+            response = self._session.get(self.card_status_url)
+            response.raise_for_status()
+            return parse_cache.parse(response, self._parse_status)
+
+        # 同一个会话同时查询状态时只发送一个请求。
+        return group.do((self._session, self.card_status_url), fetch)
+
+    @staticmethod
+    def _parse_status(html: str) -> CardStatus:
+        dom = BeautifulSoup(html, features="html.parser")
         text = (
             dom.text.replace("\n", "")
             .replace("\t", "")
@@ -129,6 +363,76 @@ class ECard:
         lost = re.search(r"挂失状态：(.{2})", text).group(1) != "正常"
         return CardStatus(reminder, frozen, lost)
 
+    def query_accounts(
+        self,
+        date1: date,
+        date2: date | None = None,
+        *,
+        accounts: Iterable[AccountInfo] | None = None,
+        max_workers: int = 4,
+    ) -> AccountsReport:
+        """同时查询多个账号（默认为所有账号）的状态和流水。
+
+        查询流水需要在服务器上保存状态，因此每个账号使用一个独立的会话，同一个账号
+        同时只有一个查询。最多同时查询 `max_workers` 个账号。`date1` 和 `date2`
+        的含义与 `get_transaction` 相同。
+        """
+        accounts = list(self.account if accounts is None else accounts)
+
+        def query(account: AccountInfo) -> tuple[CardStatus, list[AccountTransaction]]:
+            card = ECard(self._isolated_session(), check_network=False)
+            card._account_info = list(self._account_info)
+            status = card._get_status(account)
+            transactions = [
+                AccountTransaction(account, transaction)
+                for transaction in card.get_transaction(date1, date2, account=account)
+            ]
+            transactions.sort(key=lambda item: item.transaction.time, reverse=True)
+            return status, transactions
+
+        report = AccountsReport()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    lambda account, context: context.run(query, account),
+                    accounts,
+                    [contextvars.copy_context() for _ in accounts],
+                )
+            )
+        for account, (status, _) in zip(accounts, results):
+            report.status[account.id] = status
+        report.transactions = list(
+            heapq.merge(
+                *(transactions for _, transactions in results),
+                key=lambda item: item.transaction.time,
+                reverse=True,
+            )
+        )
+        return report
+
+    def _isolated_session(self) -> requests.Session:
+        # 复制统一身份认证平台的 cookies，但不复制一卡通服务的 cookies，
+        # 这样新的会话会在服务器上得到一份独立的查询状态。
+        host = urlparse(self.auth_url).hostname
+        session = requests.Session()
+        session.headers.update(self._session.headers)
+        for cookie in self._session.cookies:
+            if cookie.domain.lstrip(".") != host:
+                session.cookies.set_cookie(copy.copy(cookie))
+        for prefix, adapter in self._session.adapters.items():
+            session.mount(prefix, adapter)
+        return session
+
+    def _get_status(self, account: AccountInfo) -> CardStatus:
+        def fetch() -> CardStatus:
+            response = self._session.post(
+                self.card_status_url, data={"account": account.id}
+            )
+            response.raise_for_status()
+            return parse_cache.parse(response, self._parse_status)
+
+        return group.do((self._session, self.card_status_url, account.id), fetch)
+
     def get_transaction(
         self,
         date1: date,
@@ -146,31 +450,63 @@ class ECard:
 
         由于一卡通服务的限制，最多只能查询 30 天的历史流水和 1 天的当日流水。
         """
-        if account is None:
-            account = list(self.account)[0]
-        if date1 == date2:
-            date1, date2 = date1, None
-        if date2 is not None:
-            if date2 > date.today() or date1 > date.today():
+        yield from self.read_transaction(date1, date2, account=account, read_ahead=0)
+
+    def read_transaction(
+        self,
+        date1: date | None = None,
+        date2: date | None = None,
+        *,
+        account: AccountInfo | None = None,
+        cursor: TransactionCursor | None = None,
+        read_ahead: int = 2,
+    ) -> "TransactionReader":
+        """与 `get_transaction` 相同，但是可以从中断的位置继续查询。
+
+        返回的 `TransactionReader` 的 `cursor` 属性记录了已经返回的最后一条流水的
+        位置，查询出错时把它传给 `cursor` 参数（此时不需要 `date1` 等参数）即可从
+        那里继续，不会重复返回流水。后台线程最多预先读取 `read_ahead` 页，为 0 时
+        不预读。
+        """
+        if cursor is None:
+            if date1 is None:
+                raise ValueError("either date1 or cursor must be provided")
+            if account is None:
+                account = list(self.account)[0]
+            if date2 is None or date1 == date2:
+                date2 = date1
+            if date1 > date.today() or date2 > date.today():
                 raise ValueError("date cannot be in the future")
-            if date1 >= date2:
+            if date1 > date2:
                 date1, date2 = date2, date1
-            if date2 == date.today():
-                yield from self._get_today_transaction(account)
-                yield from self._get_history_transaction(
-                    date1, date2 - timedelta(days=1), account
-                )
-            else:
-                yield from self._get_history_transaction(date1, date2, account)
+            cursor = TransactionCursor(account.id, date1, date2, today=date.today())
+        return TransactionReader(self, cursor, read_ahead)
+
+    @staticmethod
+    def _segments(start: date, end: date, today: date) -> list[tuple[date, date]]:
+        # 以 `today` 那天为界划分为当日流水和历史流水两部分，各部分为起止日期。
+        if end < today:
+            return [(start, end)]
+        if start == today:
+            return [(today, today)]
+        return [(today, today), (start, end - timedelta(days=1))]
+
+    def _transaction_pages(
+        self,
+        segment: tuple[date, date],
+        account: AccountInfo,
+        first_page: int,
+    ) -> Iterable[tuple[int, list[CardTransaction]]]:
+        # 只有今天的流水需要查询当日流水，过了这一天就变成了历史流水。
+        if segment == (date.today(), date.today()):
+            pages = self._get_today_transaction(account, first_page)
         else:
-            if date1 > date.today():
-                raise ValueError("date cannot be in the future")
-            if date1 == date.today():
-                yield from self._get_today_transaction(account)
-            else:
-                yield from self._get_history_transaction(date1, date1, account)
+            pages = self._get_history_transaction(*segment, account, first_page)
+        yield from enumerate(pages, first_page)
 
-    def _get_today_transaction(self, account: AccountInfo) -> Iterable[CardTransaction]:
+    def _get_today_transaction(
+        self, account: AccountInfo, first_page: int = 1
+    ) -> Iterable[list[CardTransaction]]:
         response = self._session.post(
             self.today_transaction_url,
             data={"account": account.id, "inputObject": "all"},
@@ -180,77 +516,92 @@ class ECard:
 
         pages_info = dom.select("tr.bl>td>div[align=center]")[0].text
         page_count = int(re.search(r"共(\d+)页", pages_info).group(1))
-        for page in range(1, page_count + 1):
-            response = self._session.post(
-                self.today_transaction_url,
-                data={
-                    "pageVo.pageNum": page,
-                    "inputObject": "all",
-                    "account": account.id,
-                },
-            )
-            dom = BeautifulSoup(response.text, features="html.parser")
-            for element in dom.select("tr.listbg,tr.listbg2"):
-                tran_time = datetime.fromisoformat(
-                    element.find_all("td")[0].text.replace("/", "-")
-                )
-                tran_type = element.find_all("td")[3].text
-                shop_name = element.find_all("td")[4].text.strip()
-                amount = float(element.find_all("td")[5].text)
-                status = element.find_all("td")[8].text
-                comment = element.find_all("td")[9].text.strip()
-                yield CardTransaction(
-                    tran_time, tran_type, shop_name, amount, status, comment
+
+        def pages() -> Iterable[requests.Response]:
+            for page in range(first_page, page_count + 1):
+                yield self._session.post(
+                    self.today_transaction_url,
+                    data={
+                        "pageVo.pageNum": page,
+                        "inputObject": "all",
+                        "account": account.id,
+                    },
                 )
 
+        yield from offload.pipeline(pages(), self._parse_transactions)
+
     def _get_history_transaction(
-        self, start_date: date, end_date: date, account: AccountInfo
-    ) -> Iterable[CardTransaction]:
+        self,
+        start_date: date,
+        end_date: date,
+        account: AccountInfo,
+        first_page: int = 1,
+    ) -> Iterable[list[CardTransaction]]:
         if (end_date - start_date).days > 30:
             raise ValueError("data can only be queried within 30 days")
-        response = self._session.get(self.history_transaction0_url)
-        response.raise_for_status()
-        response = self._session.post(
-            self.history_transaction1_url,
-            data={"account": account.id, "inputObject": "all"},
-        )
-        response.raise_for_status()
+        # 查询历史流水前需要依次访问四个页面，每一步最多使用剩余时间的一部分，
+        # 翻页则使用全部的剩余时间。
+        with deadline.share(4):
+            response = self._session.get(self.history_transaction0_url)
+            response.raise_for_status()
+        with deadline.share(3):
+            response = self._session.post(
+                self.history_transaction1_url,
+                data={"account": account.id, "inputObject": "all"},
+            )
+            response.raise_for_status()
         input_start_date = f"{start_date:%Y%m%d}"
         input_end_date = f"{end_date:%Y%m%d}"
-        response = self._session.post(
-            self.history_transaction2_url,
-            data={"inputStartDate": input_start_date, "inputEndDate": input_end_date},
-        )
-        response.raise_for_status()
-        response = self._session.post(self.history_transaction3_url)
-        response.raise_for_status()
-
-        dom = BeautifulSoup(response.text, features="html.parser")
-        pages_info = dom.select("tr.bl>td>div[align=center]")[0].text
-        page_count = int(re.search(r"共(\d+)页", pages_info).group(1))
-        for page in range(1, page_count + 1):
+        with deadline.share(2):
             response = self._session.post(
-                self.history_transaction_list_url,
+                self.history_transaction2_url,
                 data={
                     "inputStartDate": input_start_date,
                     "inputEndDate": input_end_date,
-                    "pageNum": page,
                 },
             )
             response.raise_for_status()
-            dom = BeautifulSoup(response.text, features="html.parser")
-            for element in dom.select("tr.listbg,tr.listbg2"):
-                tran_time = datetime.fromisoformat(
-                    element.find_all("td")[0].text.replace("/", "-")
+        response = self._session.post(self.history_transaction3_url)
+        response.raise_for_status()
+
+        dom = BeautifulSoup(response.text, features="html.parser")
+        pages_info = dom.select("tr.bl>td>div[align=center]")[0].text
+        page_count = int(re.search(r"共(\d+)页", pages_info).group(1))
+
+        def pages() -> Iterable[requests.Response]:
+            for page in range(first_page, page_count + 1):
+                response = self._session.post(
+                    self.history_transaction_list_url,
+                    data={
+                        "inputStartDate": input_start_date,
+                        "inputEndDate": input_end_date,
+                        "pageNum": page,
+                    },
                 )
-                tran_type = element.find_all("td")[3].text
-                shop_name = element.find_all("td")[4].text.strip()
-                amount = float(element.find_all("td")[5].text)
-                status = element.find_all("td")[8].text
-                comment = element.find_all("td")[9].text.strip()
-                yield CardTransaction(
+                response.raise_for_status()
+                yield response
+
+        # 在 ParsePool 中时，解析前几页的同时请求下一页。
+        yield from offload.pipeline(pages(), self._parse_transactions)
+
+    @staticmethod
+    def _parse_transactions(html: str) -> list[CardTransaction]:
+        dom = BeautifulSoup(html, features="html.parser")
+        transactions = []
+        for element in dom.select("tr.listbg,tr.listbg2"):
+            columns = element.find_all("td")
+            tran_time = datetime.fromisoformat(columns[0].text.replace("/", "-"))
+            tran_type = columns[3].text
+            shop_name = columns[4].text.strip()
+            amount = float(columns[5].text)
+            status = columns[8].text
+            comment = columns[9].text.strip()
+            transactions.append(
+                CardTransaction(
                     tran_time, tran_type, shop_name, amount, status, comment
                 )
+            )
+        return transactions
 
 
 __all__ = ("ECard",)
@@ -28,10 +28,11 @@ from typing import Iterable
 import requests
 from bs4 import BeautifulSoup
 
+from suep_toolkit.singleflight import group
 from suep_toolkit.util import AuthServiceError, VPNError, test_network
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MeterState:
     """电表状态。"""
 
@@ -44,7 +45,7 @@ class MeterState:
     state: int
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class RechargeInfo:
     """充值信息。"""
 
@@ -64,9 +65,11 @@ class ElectricityManagement:
     recharge_url = "http://10.50.2.206/api/charge/Submit"
     get_room_url = "http://10.50.2.206/api/charge/GetRoom"
 
-    def __init__(self, session: requests.Session) -> None:
+    def __init__(
+        self, session: requests.Session, *, check_network: bool = True
+    ) -> None:
         self._session = session
-        if not test_network():
+        if check_network and not test_network():
             raise VPNError(
                 "you are not connected to the campus network, please turn on vpn"
             )
@@ -80,6 +83,10 @@ class ElectricityManagement:
     @property
     def meter_state(self) -> MeterState:
         """获取电表状态。"""
+        # 同一个会话同时查询电表状态时只发送一个请求。
+        return group.do((self._session, self.meter_state_url), self._get_meter_state)
+
+    def _get_meter_state(self) -> MeterState:
         response = self._session.get(
             self.meter_state_url, params={"_dc": int(time.time())}
         )
@@ -26,10 +26,12 @@ from typing import Any, Iterable
 import requests
 from bs4 import BeautifulSoup
 
+from suep_toolkit import offload
 from suep_toolkit.auth import AuthServiceError
+from suep_toolkit.memo import parse_cache
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class StudentInfo:
     """基本信息。"""
 
@@ -49,7 +51,7 @@ class StudentInfo:
     status: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class RoomInfo:
     """住宿记录。"""
 
@@ -83,7 +85,11 @@ class EStudent:
         """获取基本信息。"""
         response = self._session.get(self.student_info_url)
         response.raise_for_status()
-        dom = BeautifulSoup(response.text, features="html.parser")
+        return offload.run(self._parse_student_info, response)
+
+    @staticmethod
+    def _parse_student_info(html: str) -> StudentInfo:
+        dom = BeautifulSoup(html, features="html.parser")
 
         student_number = dom.select("input[name=XueHao]")[0].attrs["value"]
         name = dom.select("input[name=XingMing]")[0].attrs["value"]
@@ -123,15 +129,20 @@ class EStudent:
         """获取住宿记录。"""
         response = self._session.get(self.accommodation_record_url)
         response.raise_for_status()
-        dom = BeautifulSoup(response.text, features="html.parser")
+        yield from parse_cache.parse(response, self._parse_accommodation_record)
 
+    @staticmethod
+    def _parse_accommodation_record(html: str) -> tuple[RoomInfo, ...]:
+        dom = BeautifulSoup(html, features="html.parser")
+        records = []
         for line in dom.select("table>tr"):
             if len(line.select("th")) > 0:
                 continue
             info: list[Any] = [tag.text for tag in line.select("td")]
             info[3] = int(info[3])
             info[4] = not info[4] == "无"
-            yield RoomInfo(*info)
+            records.append(RoomInfo(*info))
+        return tuple(records)
 
 
 __all__ = "StudentInfo", "RoomInfo", "EStudent"
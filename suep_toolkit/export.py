@@ -0,0 +1,271 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""把流水、充值记录和住宿记录等数据导出为 CSV、JSON Lines 或 Parquet 文件。
+
+导出时逐条读取生成器中的记录，内存占用与记录总数无关。导出为 Parquet 需要
+pyarrow，可以通过 `pip install suep_toolkit[parquet]` 安装。
+"""
+
+import csv
+import dataclasses
+import itertools
+import json
+import os
+import typing
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+_types = (bool, int, float, str, datetime, date)
+
+
+class Schema:
+    """由数据类的字段得到的表结构。"""
+
+    def __init__(self, record_type: type) -> None:
+        if not dataclasses.is_dataclass(record_type):
+            raise TypeError(f"{record_type!r} is not a dataclass")
+        hints = typing.get_type_hints(record_type)
+        self.record_type = record_type
+        self.names = [field.name for field in dataclasses.fields(record_type)]
+        self.types: list[type] = []
+        for name in self.names:
+            if hints[name] not in _types:
+                raise TypeError(f"unsupported field type {hints[name]!r} of {name!r}")
+            self.types.append(hints[name])
+
+    def row(self, record: Any) -> tuple:
+        if not isinstance(record, self.record_type):
+            raise TypeError(f"expect {self.record_type.__name__}, got {record!r}")
+        return tuple(getattr(record, name) for name in self.names)
+
+
+class Writer(ABC):
+    """逐条写入记录，子类实现具体的文件格式。"""
+
+    def __init__(self, path: Path, schema: Schema, append: bool = False) -> None:
+        self.path = Path(path)
+        self.schema = schema
+        self.append = append
+        self.count = 0
+
+    def __enter__(self) -> "Writer":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @abstractmethod
+    def write(self, record: Any) -> None:
+        """写入一条记录。"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """写完所有数据并关闭文件。"""
+
+
+class CSVWriter(Writer):
+    """CSV 文件，第一行是字段名。追加时会检查已有文件的字段名。"""
+
+    def __init__(self, path: Path, schema: Schema, append: bool = False) -> None:
+        super().__init__(path, schema, append)
+        exists = append and self.path.exists() and self.path.stat().st_size > 0
+        if exists:
+            with open(self.path, newline="", encoding="utf-8") as file:
+                header = next(csv.reader(file), [])
+            if header != schema.names:
+                raise ValueError(f"{self.path} has different columns: {header}")
+        self._file = open(
+            self.path, "a" if append else "w", newline="", encoding="utf-8"
+        )
+        self._writer = csv.writer(self._file)
+        if not exists:
+            self._writer.writerow(schema.names)
+
+    def write(self, record: Any) -> None:
+        self._writer.writerow(
+            value.isoformat() if isinstance(value, date) else value
+            for value in self.schema.row(record)
+        )
+        self.count += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JSONLWriter(Writer):
+    """JSON Lines 文件，每行一个对象，日期和时间使用 ISO 8601 格式。"""
+
+    def __init__(self, path: Path, schema: Schema, append: bool = False) -> None:
+        super().__init__(path, schema, append)
+        self._file = open(self.path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, record: Any) -> None:
+        row = {
+            name: value.isoformat() if isinstance(value, date) else value
+            for name, value in zip(self.schema.names, self.schema.row(record))
+        }
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter(Writer):
+    """Parquet 文件，每 `row_group_size` 条记录写入一个行组。
+
+    Parquet 文件写完之后不能再追加，因此追加时先逐个行组地复制已有的文件（会检查
+    字段名），再写入新的记录，最后替换原来的文件，内存占用仍然只有一个行组。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        schema: Schema,
+        append: bool = False,
+        row_group_size: int = 65536,
+    ) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise ImportError(
+                "exporting to parquet requires pyarrow, "
+                "install it with 'pip install suep_toolkit[parquet]'"
+            ) from error
+
+        super().__init__(path, schema, append)
+        types = {
+            bool: pa.bool_(),
+            int: pa.int64(),
+            float: pa.float64(),
+            str: pa.string(),
+            datetime: pa.timestamp("s"),
+            date: pa.date32(),
+        }
+        self._pa = pa
+        self._arrow_schema = pa.schema(
+            [(name, types[type_]) for name, type_ in zip(schema.names, schema.types)]
+        )
+        self.row_group_size = row_group_size
+        self._columns: list[list] = [[] for _ in schema.names]
+        self._existing = None
+        if append and self.path.exists() and self.path.stat().st_size > 0:
+            self._existing = pq.ParquetFile(self.path)
+            names = self._existing.schema_arrow.names
+            if names != schema.names:
+                self._existing.close()
+                raise ValueError(f"{self.path} has different columns: {names}")
+            self._file = self.path.with_name(self.path.name + ".tmp")
+        else:
+            self._file = self.path
+        self._writer = pq.ParquetWriter(self._file, self._arrow_schema)
+        if self._existing is not None:
+            for i in range(self._existing.num_row_groups):
+                # Parquet 没有以秒为单位的时间戳，读出的类型需要转换回来。
+                self._writer.write_table(
+                    self._existing.read_row_group(i).cast(self._arrow_schema)
+                )
+
+    def write(self, record: Any) -> None:
+        for column, value in zip(self._columns, self.schema.row(record)):
+            column.append(value)
+        self.count += 1
+        if len(self._columns[0]) >= self.row_group_size:
+            self._flush()
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+        if self._existing is not None:
+            self._existing.close()
+            os.replace(self._file, self.path)
+
+    def _flush(self) -> None:
+        if len(self._columns[0]) == 0:
+            return
+        table = self._pa.Table.from_arrays(
+            [
+                self._pa.array(column, type=field.type)
+                for column, field in zip(self._columns, self._arrow_schema)
+            ],
+            schema=self._arrow_schema,
+        )
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        for column in self._columns:
+            column.clear()
+
+
+writers: dict[str, type[Writer]] = {
+    "csv": CSVWriter,
+    "jsonl": JSONLWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def export(
+    records: Iterable[Any],
+    path: Path,
+    record_type: type | None = None,
+    format: str | None = None,
+    append: bool = False,
+    **kwargs,
+) -> int:
+    """把 `records` 逐条写入文件，返回写入的记录数。
+
+    `format` 默认由文件的扩展名决定。`record_type` 默认为第一条记录的类型，
+    `records` 可能为空时应当指定它，这样才能写出表头。其余参数传给对应的 `Writer`，
+    例如 `ParquetWriter` 的 `row_group_size`。
+
+    ```python
+    export(my_card.get_transaction(date1, date2), "transactions.parquet")
+    ```
+    """
+    path = Path(path)
+    format = format or path.suffix.lstrip(".")
+    if format not in writers:
+        raise ValueError(f"unsupported format {format!r}")
+    iterator: Iterator[Any] = iter(records)
+    if record_type is None:
+        first = next(iterator, None)
+        if first is None:
+            return 0
+        record_type = type(first)
+        iterator = itertools.chain([first], iterator)
+    with writers[format](path, Schema(record_type), append, **kwargs) as writer:
+        for record in iterator:
+            writer.write(record)
+        return writer.count
+
+
+__all__ = (
+    "Schema",
+    "Writer",
+    "CSVWriter",
+    "JSONLWriter",
+    "ParquetWriter",
+    "writers",
+    "export",
+)
@@ -0,0 +1,329 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""预测宿舍电量的耗尽时间。
+
+`ElectricityForecaster` 根据历次查询到的剩余电量和充值账单，按一周中的每个小时
+学习房间的用电规律，预测电量低于阈值以及耗尽的时间，并据此决定下一次查询的时间：
+电量充足时很久才查询一次，接近阈值时频繁查询。
+
+```python
+from suep_toolkit.electricity import ElectricityManagement
+from suep_toolkit.forecast import ElectricityForecaster
+
+forecaster = ElectricityForecaster(ElectricityManagement(service.session))
+for forecast in forecaster.run():
+    print(forecast.reskwh, forecast.depletion_time)
+```
+
+此模块需要 numpy，可以通过 `pip install suep_toolkit[forecast]` 安装。
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from suep_toolkit.electricity import ElectricityManagement, MeterState, RechargeInfo
+
+try:
+    import numpy as np
+except ImportError as error:
+    raise ImportError(
+        "the forecaster requires numpy, "
+        "install it with 'pip install suep_toolkit[forecast]'"
+    ) from error
+
+
+@dataclass(frozen=True, slots=True)
+class Forecast:
+    """一次预测的结果。
+
+    `rate` 是当前每小时的用电量（千瓦时），`threshold_time` 和 `depletion_time`
+    分别是预计电量低于阈值和耗尽的时间，无法预测或超出预测范围时为 `None`。
+    `next_poll` 是距离下一次查询的秒数。
+    """
+
+    time: datetime
+    reskwh: float
+    rate: float
+    threshold_time: datetime | None
+    depletion_time: datetime | None
+    next_poll: float
+
+
+def _local_hours(timestamps: "np.ndarray") -> "np.ndarray":
+    # 1970 年 1 月 1 日是星期四，加上三天之后以星期一零点为一周的开始。
+    offset = time.localtime().tm_gmtoff
+    hours = np.floor((timestamps + offset) / 3600).astype(np.int64)
+    return (hours + 72) % ConsumptionProfile.hours_per_week
+
+
+class ConsumptionProfile:
+    """一周中每个小时的平均用电量。
+
+    相邻两次查询之间的用电量（加上期间充值的电量）被均匀地分摊到经过的每个小时上。
+    越早的数据权重越低，每过 `half_life` 秒权重减半。没有数据的小时依次使用一天中
+    同一时刻的平均值、所有数据的平均值和充值账单给出的平均值。
+    """
+
+    hours_per_week = 168
+
+    def __init__(self, half_life: float = 14 * 86400) -> None:
+        self.half_life = half_life
+        self.rates = np.full(self.hours_per_week, np.nan)
+
+    @property
+    def fitted(self) -> bool:
+        return not np.isnan(self.rates).all()
+
+    def fit(
+        self,
+        timestamps: Iterable[float],
+        reskwh: Iterable[float],
+        recharges: Iterable[RechargeInfo] = (),
+    ) -> "ConsumptionProfile":
+        """根据查询时间（Unix 时间戳）、剩余电量和充值账单学习用电规律。"""
+        t = np.asarray(list(timestamps), dtype=np.float64)
+        kwh = np.asarray(list(reskwh), dtype=np.float64)
+        order = np.argsort(t, kind="stable")
+        t, kwh = t[order], kwh[order]
+        recharges = sorted(recharges, key=lambda recharge: recharge.time)
+        recharge_t = np.array([r.time.timestamp() for r in recharges], dtype=np.float64)
+        recharge_kwh = np.array([r.quantity for r in recharges], dtype=np.float64)
+        self.rates = np.full(self.hours_per_week, np.nan)
+
+        prior = np.nan
+        if len(recharge_t) >= 2 and recharge_t[-1] > recharge_t[0]:
+            # 最后一次充值的电量还没有用完，不计入平均值。
+            prior = recharge_kwh[:-1].sum() / (recharge_t[-1] - recharge_t[0]) * 3600
+
+        if len(t) >= 2:
+            start, end = t[:-1], t[1:]
+            cumulative = np.concatenate([[0.0], np.cumsum(recharge_kwh)])
+            recharged = (
+                cumulative[np.searchsorted(recharge_t, end, side="right")]
+                - cumulative[np.searchsorted(recharge_t, start, side="right")]
+            )
+            used = kwh[:-1] - kwh[1:] + recharged
+            # 查询间隔为零或者漏记了充值（用电量为负）的区间无法使用。
+            valid = (end > start) & (used >= 0)
+            start, end, used = start[valid], end[valid], used[valid]
+            if len(start) > 0:
+                energy, seconds = self._spread(start, end, used, t[-1])
+                observed = seconds > 0
+                self.rates[observed] = energy[observed] / seconds[observed] * 3600
+
+        if np.isnan(self.rates).all():
+            self.rates[:] = prior
+            return self
+        by_hour = self.rates.reshape(7, 24)
+        days = (~np.isnan(by_hour)).sum(axis=0)
+        hourly = np.nansum(by_hour, axis=0) / np.maximum(days, 1)
+        by_hour[:] = np.where(np.isnan(by_hour) & (days > 0), hourly, by_hour)
+        self.rates[np.isnan(self.rates)] = np.nanmean(self.rates)
+        return self
+
+    def _spread(
+        self, start: "np.ndarray", end: "np.ndarray", used: "np.ndarray", now: float
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        # 把每个区间按整点切成若干段，每段分得与时长成正比的用电量。
+        first = np.floor(start / 3600).astype(np.int64)
+        count = np.floor(end / 3600).astype(np.int64) - first + 1
+        interval = np.repeat(np.arange(len(start)), count)
+        hour = first[interval] + (
+            np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        )
+        segment_start = np.maximum(hour * 3600.0, start[interval])
+        segment_end = np.minimum((hour + 1) * 3600.0, end[interval])
+        duration = segment_end - segment_start
+        weight = 0.5 ** ((now - segment_end) / self.half_life) * duration
+        rate = used / (end - start)
+        bins = _local_hours(segment_start)
+        energy = np.bincount(
+            bins, weights=rate[interval] * weight, minlength=self.hours_per_week
+        )
+        seconds = np.bincount(bins, weights=weight, minlength=self.hours_per_week)
+        return energy, seconds
+
+    def rate_at(self, timestamp: float) -> float:
+        """`timestamp` 所在的小时每小时的用电量。"""
+        return float(self.rates[_local_hours(np.array([timestamp]))[0]])
+
+    def predict(
+        self,
+        reskwh: float,
+        now: float,
+        target: float = 0.0,
+        horizon: float = 60 * 86400,
+    ) -> float | None:
+        """预测电量从 `now` 时的 `reskwh` 降到 `target` 的时间。
+
+        电量已经不高于 `target` 时返回 `now`，在 `horizon` 秒内不会降到 `target`
+        或者还没有学到用电规律时返回 `None`。
+        """
+        if reskwh <= target:
+            return now
+        if not self.fitted:
+            return None
+        hour = np.floor(now / 3600) + np.arange(int(horizon // 3600) + 1)
+        segment_start = np.maximum(hour * 3600, now)
+        segment_end = (hour + 1) * 3600
+        rate = self.rates[_local_hours(segment_start)]
+        cumulative = np.cumsum(rate * (segment_end - segment_start) / 3600)
+        index = int(np.searchsorted(cumulative, reskwh - target))
+        if index == len(cumulative) or rate[index] <= 0:
+            return None
+        return float(
+            segment_end[index]
+            - (cumulative[index] - reskwh + target) / rate[index] * 3600
+        )
+
+
+class ElectricityForecaster:
+    """自适应地查询电表状态并预测耗尽时间。
+
+    `threshold` 是提醒的电量阈值（千瓦时），默认使用电表的 `limit`。下一次查询
+    安排在预计电量低于阈值（已经低于阈值时则为耗尽）之前剩余时间的
+    `poll_fraction` 处，并限制在 `min_interval` 和 `max_interval` 秒之间。
+
+    `auto_recharge` 不为 `None` 时，在预计 `recharge_before` 秒内耗尽电量时自动
+    给自己的宿舍充值 `auto_recharge` 千瓦时。充值得太早会过早地占用余额，太晚则
+    可能来不及到账，因此只在即将耗尽时充值，并且直到查询到电量比充值时多（即充值
+    已经到账）之后才会再次自动充值。
+
+    早于 `history_half_lives` 个半衰期的查询记录权重很低，会被丢弃，以免每次
+    查询时重新学习的开销随着运行时间不断增长。
+    """
+
+    def __init__(
+        self,
+        management: ElectricityManagement,
+        *,
+        samples: Iterable[tuple[datetime, float]] = (),
+        threshold: float | None = None,
+        min_interval: float = 300,
+        max_interval: float = 12 * 3600,
+        poll_fraction: float = 0.25,
+        auto_recharge: int | None = None,
+        recharge_before: float = 86400,
+        profile: ConsumptionProfile | None = None,
+        history_half_lives: float = 4,
+    ) -> None:
+        self._management = management
+        self._timestamps = [sample_time.timestamp() for sample_time, _ in samples]
+        self._reskwh = [float(reskwh) for _, reskwh in samples]
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.poll_fraction = poll_fraction
+        self.auto_recharge = auto_recharge
+        self.recharge_before = recharge_before
+        self.profile = profile or ConsumptionProfile()
+        self.history_half_lives = history_half_lives
+        self._recharges: list[RechargeInfo] | None = None
+        self._recharge_count: int | None = None
+        self._recharged_at: float | None = None
+
+    @property
+    def samples(self) -> list[tuple[datetime, float]]:
+        """目前为止的查询时间和剩余电量。"""
+        return [
+            (datetime.fromtimestamp(timestamp), reskwh)
+            for timestamp, reskwh in zip(self._timestamps, self._reskwh)
+        ]
+
+    def observe(
+        self, state: MeterState | None = None, at: datetime | None = None
+    ) -> Forecast:
+        """记录一次电表状态（默认立即查询）并重新预测。"""
+        if state is None:
+            state = self._management.meter_state
+        now = time.time() if at is None else at.timestamp()
+        if self._recharges is None or state.recharges != self._recharge_count:
+            # 只在充值次数变化时重新获取充值账单。
+            self._recharges = list(self._management.recharge_info)
+            self._recharge_count = state.recharges
+        self._timestamps.append(now)
+        self._reskwh.append(state.reskwh)
+        self._trim(now)
+        self.profile.fit(self._timestamps, self._reskwh, self._recharges)
+
+        threshold = state.limit if self.threshold is None else self.threshold
+        threshold_time = self.profile.predict(state.reskwh, now, threshold)
+        depletion_time = self.profile.predict(state.reskwh, now)
+        if not self.profile.fitted:
+            # 还没有学到用电规律，尽快收集数据。
+            next_poll = self.min_interval
+        else:
+            target = depletion_time if state.reskwh <= threshold else threshold_time
+            if target is None:
+                next_poll = self.max_interval
+            else:
+                next_poll = (target - now) * self.poll_fraction
+            next_poll = min(self.max_interval, max(self.min_interval, next_poll))
+
+        if self._recharged_at is not None and state.reskwh > self._recharged_at:
+            # 上一次自动充值已经到账。
+            self._recharged_at = None
+        if (
+            self.auto_recharge is not None
+            and self._recharged_at is None
+            and depletion_time is not None
+            and depletion_time - now <= self.recharge_before
+        ):
+            self._management.recharge_my_room(self.auto_recharge)
+            self._recharged_at = state.reskwh
+
+        return Forecast(
+            datetime.fromtimestamp(now),
+            state.reskwh,
+            self.profile.rate_at(now) if self.profile.fitted else float("nan"),
+            None if threshold_time is None else datetime.fromtimestamp(threshold_time),
+            None if depletion_time is None else datetime.fromtimestamp(depletion_time),
+            next_poll,
+        )
+
+    def _trim(self, now: float) -> None:
+        # 丢弃过早的查询记录，但至少保留最近两次以便计算用电量。
+        cutoff = now - self.history_half_lives * self.profile.half_life
+        recent = sorted(self._timestamps)[-2:]
+        kept = [
+            (timestamp, reskwh)
+            for timestamp, reskwh in zip(self._timestamps, self._reskwh)
+            if timestamp >= cutoff or timestamp in recent
+        ]
+        if len(kept) < len(self._timestamps):
+            self._timestamps = [timestamp for timestamp, _ in kept]
+            self._reskwh = [reskwh for _, reskwh in kept]
+
+    def run(self, stop: threading.Event | None = None) -> Iterator[Forecast]:
+        """不断地查询电表状态并产生预测，直到 `stop` 被设置。"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            forecast = self.observe()
+            yield forecast
+            stop.wait(forecast.next_poll)
+
+
+__all__ = "Forecast", "ConsumptionProfile", "ElectricityForecaster"
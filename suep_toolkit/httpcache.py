@@ -0,0 +1,361 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import contextvars
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3 import HTTPResponse
+
+from suep_toolkit.transport import AdapterWrapper
+from suep_toolkit.transport import install as install_wrapper
+from suep_toolkit.util import cache_dir
+
+
+@dataclass
+class CacheRule:
+    """一类响应的缓存规则。
+
+    响应在 `max_age` 秒内直接使用；之后的 `stale_while_revalidate` 秒内仍然先返回
+    缓存的响应，同时在后台重新请求。`ignore_params` 中的查询参数（例如防止浏览器
+    缓存的时间戳）不参与比较。
+    """
+
+    max_age: float
+    stale_while_revalidate: float = 0
+    ignore_params: tuple[str, ...] = ("_dc",)
+
+
+@dataclass
+class CacheInfo:
+    """响应缓存的统计信息。"""
+
+    hits: int
+    stale_hits: int
+    misses: int
+    entries: int
+    size: int
+    max_size: int
+
+
+_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("bypass", default=False)
+
+
+@contextmanager
+def no_cache() -> Iterator[None]:
+    """在 `with` 语句块中总是请求服务器，得到的响应仍然会被缓存。"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class ResponseCache:
+    """保存在硬盘上的 HTTP 响应缓存。
+
+    只缓存 `rules` 中列出的 URL（以前缀匹配）的 GET 请求的 200 响应，不保存
+    `Set-Cookie` 头。每个用户使用一个单独的数据库文件，不同账号之间不会共享响应。
+    总大小超过 `max_size` 字节时丢弃最久没有使用的响应。
+
+    URL 中包含 `write_endpoints` 中任意一项的请求不经过缓存，并且会使同一主机的
+    所有缓存失效，因为它们会修改服务器上的数据。
+    """
+
+    default_rules = {
+        "https://estudent.shiep.edu.cn/GeRCZ/JiBXX.aspx": CacheRule(
+            24 * 3600, 7 * 24 * 3600
+        ),
+        "http://10.168.103.76/accounttodayTrjn.action": CacheRule(24 * 3600, 24 * 3600),
+        "http://10.50.2.206/api/charge/GetRoom": CacheRule(
+            7 * 24 * 3600, 30 * 24 * 3600
+        ),
+        "https://jw.shiep.edu.cn/eams/courseTableForStd!courseTable.action": (
+            CacheRule(3600, 24 * 3600)
+        ),
+    }
+    write_endpoints = ("batchOperator", "charge/Submit")
+
+    def __init__(
+        self,
+        partition: str | None = None,
+        rules: dict[str, CacheRule] | None = None,
+        max_size: int = 32 * 1024 * 1024,
+        directory: Path | None = None,
+    ) -> None:
+        self.rules = dict(self.default_rules if rules is None else rules)
+        self.max_size = max_size
+        directory = directory or cache_dir() / "http"
+        directory.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha256((partition or "").encode()).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            directory / f"{name}.sqlite3", check_same_thread=False, timeout=30
+        )
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS response (
+                key TEXT PRIMARY KEY, host TEXT, url TEXT, status INTEGER,
+                reason TEXT, headers TEXT, body BLOB, size INTEGER,
+                stored_at REAL, accessed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS response_accessed_at
+                ON response (accessed_at);
+            """)
+        self._hits = self._stale_hits = self._misses = 0
+        self._revalidating: set[str] = set()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        with self._lock:
+            self._db.close()
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response"
+            ).fetchone()
+            return CacheInfo(
+                self._hits,
+                self._stale_hits,
+                self._misses,
+                entries,
+                size,
+                self.max_size,
+            )
+
+    def clear(self, host: str | None = None) -> None:
+        """清空缓存，或者只清空某个主机的缓存。"""
+        with self._lock:
+            if host is None:
+                self._db.execute("DELETE FROM response")
+            else:
+                self._db.execute("DELETE FROM response WHERE host = ?", (host,))
+            self._db.commit()
+
+    def send(
+        self,
+        adapter: BaseAdapter,
+        request: requests.PreparedRequest,
+        **kwargs,
+    ) -> requests.Response:
+        """经过缓存发送请求，`adapter` 用于实际发送请求。"""
+        url = request.url or ""
+        if any(endpoint in url for endpoint in self.write_endpoints):
+            self.clear(urlsplit(url).hostname)
+            return adapter.send(request, **kwargs)
+        rule = self._rule(url)
+        if request.method != "GET" or rule is None:
+            return adapter.send(request, **kwargs)
+
+        key = self._key(url, rule)
+        if not _bypass.get():
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT url, status, reason, headers, body, stored_at "
+                    "FROM response WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    age = time.time() - row[5]
+                    fresh = age < rule.max_age
+                    usable = age < rule.max_age + rule.stale_while_revalidate
+                    if usable:
+                        self._db.execute(
+                            "UPDATE response SET accessed_at = ? WHERE key = ?",
+                            (time.time(), key),
+                        )
+                        self._db.commit()
+                        if fresh:
+                            self._hits += 1
+                        else:
+                            self._stale_hits += 1
+            if row is not None and usable:
+                if not fresh:
+                    self._revalidate(adapter, request, key, kwargs)
+                return self._build_response(request, *row[:5])
+
+        with self._lock:
+            self._misses += 1
+        response = adapter.send(request, **kwargs)
+        self._store(key, response)
+        return response
+
+    def _revalidate(
+        self,
+        adapter: BaseAdapter,
+        request: requests.PreparedRequest,
+        key: str,
+        kwargs: dict,
+    ) -> None:
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2)
+
+        def revalidate() -> None:
+            try:
+                self._store(key, adapter.send(request.copy(), **kwargs))
+            except requests.RequestException:
+                pass
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        self._executor.submit(revalidate)
+
+    def _store(self, key: str, response: requests.Response) -> None:
+        if response.status_code != 200:
+            return
+        if "no-store" in response.headers.get("Cache-Control", ""):
+            return
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() != "set-cookie"
+        }
+        body = response.content
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    urlsplit(response.url).hostname,
+                    response.url,
+                    response.status_code,
+                    response.reason,
+                    json.dumps(headers),
+                    body,
+                    len(body),
+                    now,
+                    now,
+                ),
+            )
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM response"
+            ).fetchone()[0]
+            for old_key, size in self._db.execute(
+                "SELECT key, size FROM response ORDER BY accessed_at"
+            ).fetchall():
+                if total <= self.max_size:
+                    break
+                self._db.execute("DELETE FROM response WHERE key = ?", (old_key,))
+                total -= size
+            self._db.commit()
+
+    def _rule(self, url: str) -> CacheRule | None:
+        for prefix, rule in self.rules.items():
+            if url.startswith(prefix):
+                return rule
+        return None
+
+    @staticmethod
+    def _key(url: str, rule: CacheRule) -> str:
+        parts = urlsplit(url)
+        query = urlencode(
+            sorted(
+                (name, value)
+                for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                if name not in rule.ignore_params
+            )
+        )
+        return urlunsplit(parts._replace(query=query, fragment=""))
+
+    @staticmethod
+    def _build_response(
+        request: requests.PreparedRequest,
+        url: str,
+        status: int,
+        reason: str,
+        headers: str,
+        body: bytes,
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = url
+        response.request = request
+        # 内容已经完整地读出，iter_content() 和 close() 不会再访问 raw；raw 仍然
+        # 可以读出同样的内容。保存的内容已经解压，raw 的头部要与之相符。
+        response._content = body
+        response._content_consumed = True
+        raw_headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in ("content-encoding", "content-length")
+        }
+        raw_headers["Content-Length"] = str(len(body))
+        response.raw = HTTPResponse(
+            body=io.BytesIO(body),
+            headers=raw_headers,
+            status=status,
+            reason=reason,
+            preload_content=False,
+            decode_content=False,
+        )
+        return response
+
+
+class CacheAdapter(AdapterWrapper):
+    """让请求经过响应缓存。"""
+
+    def __init__(self, adapter: BaseAdapter, cache: ResponseCache) -> None:
+        super().__init__(adapter)
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        return self.cache.send(self.adapter, request, **kwargs)
+
+
+def install(session: requests.Session, cache: ResponseCache) -> None:
+    """让会话的请求经过 `cache`。"""
+    install_wrapper(session, lambda adapter: CacheAdapter(adapter, cache))
+
+
+__all__ = (
+    "CacheRule",
+    "CacheInfo",
+    "no_cache",
+    "ResponseCache",
+    "CacheAdapter",
+    "install",
+)
@@ -0,0 +1,109 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, TypeVar
+
+import requests
+
+from suep_toolkit import offload
+
+T = TypeVar("T")
+
+
+@dataclass
+class CacheInfo:
+    """解析缓存的统计信息。"""
+
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+
+class ParseCache:
+    """按响应内容缓存解析结果。
+
+    轮询时服务器返回的页面往往与上一次完全相同，这时直接返回上一次的解析结果，
+    不必重新构建 BeautifulSoup 树。服务器提供了 `ETag` 或 `Last-Modified` 时以它们
+    （连同请求本身）作为键，否则以响应内容的哈希值作为键。最多保存 `max_size`
+    个结果，超出时丢弃最久没有使用的结果。
+
+    同一个结果会返回给所有调用者，因此解析函数应当返回不可变的值，例如由
+    不可变的记录组成的元组。
+    """
+
+    def __init__(self, max_size: int = 128) -> None:
+        self.max_size = max_size
+        self._results: OrderedDict[tuple, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def parse(self, response: requests.Response, parser: Callable[[str], T]) -> T:
+        """用 `parser` 解析 `response.text`，内容没有变化时直接返回缓存的结果。"""
+        key = (parser, *self._key(response))
+        with self._lock:
+            if key in self._results:
+                self._hits += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+            self._misses += 1
+        result = offload.run(parser, response)
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return result
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self._hits, self._misses, len(self._results), self.max_size
+            )
+
+    def clear(self) -> None:
+        """清空缓存和统计信息。"""
+        with self._lock:
+            self._results.clear()
+            self._hits = self._misses = 0
+
+    @staticmethod
+    def _key(response: requests.Response) -> tuple:
+        validator = response.headers.get("ETag") or response.headers.get(
+            "Last-Modified"
+        )
+        if validator is not None:
+            request = response.request
+            return "validator", request.method, response.url, request.body, validator
+        digest = hashlib.blake2b(response.content, digest_size=16).digest()
+        return "content", response.encoding, digest
+
+
+parse_cache = ParseCache()
+
+
+__all__ = "CacheInfo", "ParseCache", "parse_cache"
@@ -0,0 +1,175 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""在进程池中解析页面。
+
+解析 HTML 主要消耗 CPU 并且持有 GIL，因此无论开多少个线程发送请求，解析的速度
+都被限制在一个核心上。在 `ParsePool` 的 `with` 语句块中，各模块会把响应内容通过
+共享内存交给进程池解析，多页的查询还会在解析前一页的同时请求下一页：
+
+```python
+from suep_toolkit.offload import ParsePool
+
+with ParsePool():
+    transactions = list(my_card.get_transaction(date1, date2))
+```
+
+进程池只对进入 `with` 语句块的线程（以及复制了它的上下文的线程，例如各模块
+内部用于并发请求的线程）生效，其它线程仍然在本线程中解析。
+
+解析函数必须能被 pickle（模块级函数或静态方法），并且返回能被 pickle 的结果。
+"""
+
+import contextvars
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Iterable, Iterator, TypeVar
+
+import requests
+
+T = TypeVar("T")
+
+_active: contextvars.ContextVar["ParsePool | None"] = contextvars.ContextVar(
+    "parse_pool", default=None
+)
+
+
+def _parse_shared(parser: Callable[[str], T], name: str, size: int, encoding: str) -> T:
+    memory = shared_memory.SharedMemory(name)
+    try:
+        with memory.buf[:size] as view:
+            text = str(view, encoding, errors="replace")
+    finally:
+        memory.close()
+    return parser(text)
+
+
+class ParsePool:
+    """解析页面的进程池。
+
+    最多同时有 `max_pending` 个页面等待解析，超出时提交页面的线程会等待，
+    避免请求的速度远快于解析的速度时占用过多内存。
+
+    同一个进程池可以嵌套或者在多个线程中同时进入 `with` 语句块，最后一个语句块
+    退出时才会关闭进程池。
+    """
+
+    def __init__(
+        self, max_workers: int | None = None, max_pending: int | None = None
+    ) -> None:
+        max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * max_workers)
+        # 每个线程各自进入和退出 `with` 语句块，需要各自保存恢复用的令牌。
+        self._tokens = threading.local()
+        self._lock = threading.Lock()
+        self._entered = 0
+
+    def __enter__(self) -> "ParsePool":
+        if not hasattr(self._tokens, "stack"):
+            self._tokens.stack = []
+        with self._lock:
+            self._entered += 1
+        self._tokens.stack.append(_active.set(self))
+        return self
+
+    def __exit__(self, *args) -> None:
+        _active.reset(self._tokens.stack.pop())
+        with self._lock:
+            self._entered -= 1
+            last = self._entered == 0
+        if last:
+            self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def submit(
+        self, parser: Callable[[str], T], response: requests.Response
+    ) -> "Future[T]":
+        """把响应内容交给进程池解析。"""
+        data = response.content
+        encoding = response.encoding or response.apparent_encoding or "utf-8"
+        self._slots.acquire()
+        try:
+            memory = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        except BaseException:
+            self._slots.release()
+            raise
+        memory.buf[: len(data)] = data
+
+        def release(_: Future) -> None:
+            memory.close()
+            memory.unlink()
+            self._slots.release()
+
+        try:
+            future = self._executor.submit(
+                _parse_shared, parser, memory.name, len(data), encoding
+            )
+        except BaseException:
+            release(Future())
+            raise
+        future.add_done_callback(release)
+        return future
+
+    def parse(self, parser: Callable[[str], T], response: requests.Response) -> T:
+        """在进程池中解析响应内容并等待结果。"""
+        return self.submit(parser, response).result()
+
+
+def run(parser: Callable[[str], T], response: requests.Response) -> T:
+    """解析响应内容，在 `ParsePool` 中时交给进程池。"""
+    pool = _active.get()
+    if pool is None:
+        return parser(response.text)
+    return pool.parse(parser, response)
+
+
+def pipeline(
+    responses: Iterable[requests.Response],
+    parser: Callable[[str], T],
+    depth: int = 4,
+) -> Iterator[T]:
+    """按顺序解析一系列响应。
+
+    在 `ParsePool` 中时，最多有 `depth` 个页面同时在解析，获取下一个响应（通常是
+    发送下一个请求）与解析之前的页面同时进行。
+    """
+    pool = _active.get()
+    if pool is None:
+        for response in responses:
+            yield parser(response.text)
+        return
+    futures: deque[Future] = deque()
+    for response in responses:
+        futures.append(pool.submit(parser, response))
+        if len(futures) >= depth:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+__all__ = "ParsePool", "run", "pipeline"
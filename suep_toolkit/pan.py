@@ -20,6 +20,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import contextvars
+import hashlib
+import json
+import mmap
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable
+from urllib.parse import quote
+
 import requests
 from bs4 import BeautifulSoup
 
@@ -27,14 +38,125 @@ from suep_toolkit.auth import AuthService
 from suep_toolkit.util import AuthServiceError, VPNError, test_network
 
 
+class CloudDriveError(Exception):
+    """云盘操作失败时引发此异常。"""
+
+    pass
+
+
+@dataclass
+class LibraryInfo:
+    """资料库信息。"""
+
+    id: str
+    name: str
+    size: int
+    mtime: datetime
+
+
+@dataclass
+class FileEntry:
+    """文件或目录信息。
+
+    `id` 是云盘中的对象 ID，文件内容改变时它也会改变。
+    """
+
+    path: str
+    name: str
+    type: str
+    size: int
+    mtime: datetime
+    id: str
+
+
+@dataclass
+class TransferResult:
+    """上传或下载的结果。"""
+
+    path: Path
+    size: int
+    sha256: str
+    resumed_chunks: int
+
+
+class _ChunkMap:
+    """记录已经传输完成的分块，用于断点续传。"""
+
+    def __init__(self, path: Path, meta: dict[str, Any]) -> None:
+        self._path = path
+        self._meta = meta
+        self._done: dict[int, str] = {}
+        try:
+            data = json.loads(path.read_text())
+            if data["meta"] == meta:
+                self._done = {int(k): v for k, v in data["done"].items()}
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def __contains__(self, index: int) -> bool:
+        return index in self._done
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def add(self, index: int, digest: str) -> None:
+        self._done[index] = digest
+        temp_path = self._path.with_name(self._path.name + ".tmp")
+        temp_path.write_text(json.dumps({"meta": self._meta, "done": self._done}))
+        temp_path.replace(self._path)
+
+    def clear(self) -> None:
+        self._done.clear()
+        self.remove()
+
+    def remove(self) -> None:
+        self._path.unlink(missing_ok=True)
+
+
+class _OrderedHasher:
+    """按顺序计算整个文件的摘要。
+
+    分块完成的顺序是任意的，每当已完成的部分向后连续延伸时，
+    就从内存映射中读取这一段并更新摘要，因此不需要额外的内存。
+    """
+
+    def __init__(self, buffer: mmap.mmap | bytes, chunk_size: int) -> None:
+        self._buffer = buffer
+        self._chunk_size = chunk_size
+        self._hash = hashlib.sha256()
+        self._finished: set[int] = set()
+        self._next = 0
+
+    def finish(self, index: int) -> None:
+        self._finished.add(index)
+        while self._next in self._finished:
+            self._finished.remove(self._next)
+            start = self._next * self._chunk_size
+            self._hash.update(self._buffer[start : start + self._chunk_size])
+            self._next += 1
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
 class CloudDrive:
     """上电云盘。"""
 
     sso_url = "https://pan.shiep.edu.cn/sso"
+    libraries_url = "https://pan.shiep.edu.cn/api2/repos/"
+    dir_url = "https://pan.shiep.edu.cn/api2/repos/{}/dir/"
+    file_url = "https://pan.shiep.edu.cn/api2/repos/{}/file/"
+    file_detail_url = "https://pan.shiep.edu.cn/api2/repos/{}/file/detail/"
+    upload_link_url = "https://pan.shiep.edu.cn/api2/repos/{}/upload-link/"
+
+    chunk_size = 8 * 1024 * 1024
+    _block_size = 64 * 1024
 
-    def __init__(self, session: requests.Session) -> None:
+    def __init__(
+        self, session: requests.Session, *, check_network: bool = True
+    ) -> None:
         self._session = session
-        if not test_network():
+        if check_network and not test_network():
             raise VPNError(
                 "you are not connected to the campus network, please turn on vpn"
             )
@@ -47,5 +169,329 @@ class CloudDrive:
         if len(dom.select("div[class=auth_page_wrapper]")) > 0:
             raise AuthServiceError("must login first")
 
+    @property
+    def libraries(self) -> Iterable[LibraryInfo]:
+        """获取资料库列表。"""
+        response = self._session.get(self.libraries_url)
+        response.raise_for_status()
+
+        for library in response.json():
+            yield LibraryInfo(
+                library["id"],
+                library["name"],
+                int(library["size"]),
+                datetime.fromtimestamp(library["mtime"]),
+            )
+
+    def list_dir(self, library_id: str, path: str = "/") -> list[FileEntry]:
+        """列出资料库中某个目录下的文件和子目录。"""
+        response = self._session.get(
+            self.dir_url.format(library_id), params={"p": path}
+        )
+        response.raise_for_status()
+
+        parent = path.rstrip("/")
+        return [
+            FileEntry(
+                f"{parent}/{entry['name']}",
+                entry["name"],
+                entry["type"],
+                int(entry.get("size", 0)),
+                datetime.fromtimestamp(entry["mtime"]),
+                entry["id"],
+            )
+            for entry in response.json()
+        ]
+
+    def list_dir_if_changed(
+        self, library_id: str, path: str, dir_id: str | None
+    ) -> tuple[str, list[FileEntry] | None]:
+        """若目录的对象 ID 不再是 `dir_id`，则列出目录。
+
+        返回目录当前的对象 ID 和目录内容，目录未改变时目录内容为 `None`。
+        目录的对象 ID 由整个子树的内容决定，因此它未改变时整个子树都没有改变。
+        """
+        params = {"p": path}
+        if dir_id is not None:
+            params["oid"] = dir_id
+        response = self._session.get(self.dir_url.format(library_id), params=params)
+        response.raise_for_status()
+
+        current_id = response.headers.get("oid", "")
+        if response.text.strip('"') == "uptodate":
+            return dir_id or current_id, None
+        parent = path.rstrip("/")
+        return current_id, [
+            FileEntry(
+                f"{parent}/{entry['name']}",
+                entry["name"],
+                entry["type"],
+                int(entry.get("size", 0)),
+                datetime.fromtimestamp(entry["mtime"]),
+                entry["id"],
+            )
+            for entry in response.json()
+        ]
+
+    def make_dir(self, library_id: str, path: str) -> None:
+        """创建目录，父目录不存在时会一并创建。"""
+        response = self._session.post(
+            self.dir_url.format(library_id),
+            params={"p": path},
+            data={"operation": "mkdir", "create_parents": "true"},
+            headers=self._csrf_headers(),
+        )
+        response.raise_for_status()
+
+    def move(self, library_id: str, path: str, new_path: str) -> None:
+        """移动或重命名文件。"""
+        old_dir, old_name = path.rsplit("/", 1)
+        new_dir, new_name = new_path.rsplit("/", 1)
+        if old_dir != new_dir:
+            response = self._session.post(
+                self.file_url.format(library_id),
+                params={"p": path},
+                data={
+                    "operation": "move",
+                    "dst_repo": library_id,
+                    "dst_dir": new_dir or "/",
+                },
+                headers=self._csrf_headers(),
+            )
+            response.raise_for_status()
+        if old_name != new_name:
+            response = self._session.post(
+                self.file_url.format(library_id),
+                params={"p": f"{new_dir}/{old_name}"},
+                data={"operation": "rename", "newname": new_name},
+                headers=self._csrf_headers(),
+            )
+            response.raise_for_status()
+
+    def delete(self, library_id: str, path: str) -> None:
+        """删除文件。"""
+        response = self._session.delete(
+            self.file_url.format(library_id),
+            params={"p": path},
+            headers=self._csrf_headers(),
+        )
+        response.raise_for_status()
+
+    def download(
+        self,
+        library_id: str,
+        path: str,
+        destination: Path,
+        *,
+        workers: int = 4,
+        chunk_size: int | None = None,
+    ) -> TransferResult:
+        """下载文件。
+
+        文件被分成若干块，由 `workers` 个线程用 HTTP 范围请求并行下载，
+        直接写入预先分配好的内存映射文件中。下载中断后再次调用此方法会从中断处继续。
+        """
+        chunk_size = chunk_size or self.chunk_size
+        response = self._session.get(
+            self.file_detail_url.format(library_id), params={"p": path}
+        )
+        response.raise_for_status()
+        detail = response.json()
+        size = int(detail["size"])
+        # `reuse=1` 使下载链接可以被多个范围请求重复使用。
+        response = self._session.get(
+            self.file_url.format(library_id), params={"p": path, "reuse": 1}
+        )
+        response.raise_for_status()
+        url = response.json()
+
+        destination = Path(destination)
+        part_path = destination.with_name(destination.name + ".part")
+        chunk_map = _ChunkMap(
+            destination.with_name(destination.name + ".part.json"),
+            {"id": detail["id"], "size": size, "chunk_size": chunk_size},
+        )
+        if not part_path.exists():
+            chunk_map.clear()
+        resumed = len(chunk_map)
+
+        with open(part_path, "r+b" if part_path.exists() else "w+b") as file:
+            file.truncate(size)
+            if size == 0:
+                digest = hashlib.sha256().hexdigest()
+            else:
+                with mmap.mmap(file.fileno(), size) as buffer:
+                    digest = self._run_chunks(
+                        buffer,
+                        size,
+                        chunk_size,
+                        chunk_map,
+                        workers,
+                        lambda start, end: self._download_chunk(
+                            url, buffer, start, end
+                        ),
+                    )
+                    buffer.flush()
+        part_path.replace(destination)
+        chunk_map.remove()
+        return TransferResult(destination, size, digest, resumed)
+
+    def upload(
+        self,
+        library_id: str,
+        source: Path,
+        parent_dir: str = "/",
+        *,
+        workers: int = 3,
+        chunk_size: int | None = None,
+    ) -> TransferResult:
+        """上传文件，同名文件会被覆盖。
+
+        文件被分成若干块，由 `workers` 个线程并行上传。上传中断后再次调用此方法
+        会从中断处继续。
+        """
+        chunk_size = chunk_size or self.chunk_size
+        source = Path(source)
+        stat = source.stat()
+        size = stat.st_size
+        response = self._session.get(
+            self.upload_link_url.format(library_id), params={"p": parent_dir}
+        )
+        response.raise_for_status()
+        url = response.json()
+
+        chunk_map = _ChunkMap(
+            source.with_name(source.name + ".upload.json"),
+            {
+                "library": library_id,
+                "parent_dir": parent_dir,
+                "size": size,
+                "mtime": stat.st_mtime_ns,
+                "chunk_size": chunk_size,
+            },
+        )
+        resumed = len(chunk_map)
+
+        with open(source, "rb") as file:
+            if size == 0:
+                self._upload_chunk(url, source.name, parent_dir, b"", 0, 0)
+                digest = hashlib.sha256().hexdigest()
+            else:
+                with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+                    digest = self._run_chunks(
+                        buffer,
+                        size,
+                        chunk_size,
+                        chunk_map,
+                        workers,
+                        lambda start, end: self._upload_chunk(
+                            url, source.name, parent_dir, buffer, start, end, size
+                        ),
+                        last_alone=True,
+                    )
+        chunk_map.remove()
+        return TransferResult(source, size, digest, resumed)
+
+    def _csrf_headers(self) -> dict[str, str]:
+        # 使用 cookies 登陆时，修改数据的请求需要附带 CSRF 令牌。
+        token = self._session.cookies.get("sfcsrftoken", "")
+        return {"X-CSRFToken": token, "Referer": "https://pan.shiep.edu.cn/"}
+
+    def _run_chunks(
+        self,
+        buffer: mmap.mmap,
+        size: int,
+        chunk_size: int,
+        chunk_map: _ChunkMap,
+        workers: int,
+        transfer: Callable[[int, int], str],
+        last_alone: bool = False,
+    ) -> str:
+        count = (size + chunk_size - 1) // chunk_size
+        hasher = _OrderedHasher(buffer, chunk_size)
+        pending = []
+        for index in range(count):
+            if index in chunk_map:
+                hasher.finish(index)
+            else:
+                pending.append(index)
+        # 上传时最后一块必须在其它块都完成之后单独发送，服务器收到最后一块时才会合并文件。
+        last = []
+        if last_alone and count - 1 in pending:
+            last = [pending.pop()]
+
+        def run(indexes: list[int]) -> None:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures: dict[Future, int] = {}
+                for index in indexes:
+                    start = index * chunk_size
+                    end = min(start + chunk_size, size)
+                    # 在线程中沿用调用者的请求优先级。
+                    context = contextvars.copy_context()
+                    futures[executor.submit(context.run, transfer, start, end)] = index
+                remaining = set(futures)
+                while remaining:
+                    finished, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        chunk_map.add(futures[future], future.result())
+                        hasher.finish(futures[future])
+
+        run(pending)
+        run(last)
+        return hasher.hexdigest()
+
+    def _download_chunk(self, url: str, buffer: mmap.mmap, start: int, end: int) -> str:
+        response = self._session.get(
+            url, headers={"Range": f"bytes={start}-{end - 1}"}, stream=True
+        )
+        with response:
+            response.raise_for_status()
+            if response.status_code != 206 and not (start == 0 and end == len(buffer)):
+                raise CloudDriveError("server does not support range requests")
+            chunk_hash = hashlib.sha256()
+            offset = start
+            for block in response.iter_content(self._block_size):
+                if offset + len(block) > end:
+                    raise CloudDriveError("server sent more data than requested")
+                buffer[offset : offset + len(block)] = block
+                chunk_hash.update(block)
+                offset += len(block)
+        if offset != end:
+            raise CloudDriveError("connection closed before the chunk was complete")
+        return chunk_hash.hexdigest()
+
+    def _upload_chunk(
+        self,
+        url: str,
+        name: str,
+        parent_dir: str,
+        buffer: mmap.mmap | bytes,
+        start: int,
+        end: int,
+        size: int | None = None,
+    ) -> str:
+        chunk = buffer[start:end]
+        headers = {}
+        if size is not None:
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+            headers["Content-Disposition"] = (
+                f"attachment; filename*=UTF-8''{quote(name)}"
+            )
+        response = self._session.post(
+            url,
+            params={"ret-json": 1},
+            data={"parent_dir": parent_dir, "replace": 1},
+            files={"file": (name, chunk)},
+            headers=headers,
+        )
+        response.raise_for_status()
+        return hashlib.sha256(chunk).hexdigest()
+
 
-__all__ = ("CloudDrive",)
+__all__ = (
+    "CloudDriveError",
+    "LibraryInfo",
+    "FileEntry",
+    "TransferResult",
+    "CloudDrive",
+)
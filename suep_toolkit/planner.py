@@ -0,0 +1,125 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from typing import Iterable
+
+from suep_toolkit.course import Course
+
+
+class ElectionPlanner:
+    """选课方案规划。
+
+    `wishes` 按优先级从高到低排列，每个志愿是若干个可以互相替代的课程（例如同一门课的
+    不同课程序号），也按优先级从高到低排列。规划时首先尽量满足优先级高的志愿，
+    其次尽量选择每个志愿中靠前的课程，并保证选中的课程之间以及与 `occupied`
+    （已经选上的课程的位集合）之间没有时间冲突。
+    """
+
+    def __init__(self, wishes: Iterable[Iterable[Course]], occupied: int = 0) -> None:
+        self._wishes = [list(wish) for wish in wishes]
+        self._occupied = occupied
+        self._unavailable: set[int] = set()
+        self._elected: dict[int, Course] = {}
+        self._plan: list[Course] = []
+        self.replan()
+
+    @property
+    def plan(self) -> list[Course]:
+        """当前方案中还需要选的课程，按志愿的优先级排列。"""
+        return list(self._plan)
+
+    @property
+    def elected(self) -> list[Course]:
+        """已经选上的课程。"""
+        return list(self._elected.values())
+
+    @property
+    def finished(self) -> bool:
+        """当前方案中的课程是否都已经选上。"""
+        return len(self._plan) == 0
+
+    def mark_full(self, course: Course) -> list[Course]:
+        """标记课程已满（或因其它原因无法选择），并返回新的方案。"""
+        self._unavailable.add(course.id)
+        return self.replan()
+
+    def mark_elected(self, course: Course) -> list[Course]:
+        """标记课程已经选上，并返回新的方案。"""
+        self._elected[course.id] = course
+        self._occupied |= course.time_slots
+        return self.replan()
+
+    def replan(self) -> list[Course]:
+        """重新计算方案。"""
+        wishes = []
+        for wish in self._wishes:
+            # 已经有课程选上的志愿不再参与规划。
+            if any(course.id in self._elected for course in wish):
+                continue
+            wishes.append(
+                [course for course in wish if course.id not in self._unavailable]
+            )
+
+        best_key: tuple | None = None
+        best_choice: list[int] = []
+        choice: list[int] = []
+
+        def search(index: int, occupied: int, skipped: tuple) -> None:
+            nonlocal best_key, best_choice
+            if best_key is not None:
+                best_skipped, best_choices = best_key
+                prefix = best_skipped[:index]
+                # 已经比最优方案少满足了一个更高优先级的志愿。
+                if skipped > prefix:
+                    return
+                # 最优方案满足了剩下的所有志愿，而当前方案选的课程已经更靠后了。
+                if (
+                    skipped == prefix
+                    and not any(best_skipped[index:])
+                    and tuple(choice) > best_choices[:index]
+                ):
+                    return
+            if index == len(wishes):
+                key = (skipped, tuple(choice))
+                if best_key is None or key < best_key:
+                    best_key, best_choice = key, list(choice)
+                return
+            feasible = False
+            for i, course in enumerate(wishes[index]):
+                if course.time_slots & occupied == 0:
+                    feasible = True
+                    choice.append(i)
+                    search(index + 1, occupied | course.time_slots, skipped + (0,))
+                    choice.pop()
+            # 满足一个志愿总是优于满足任意多个优先级更低的志愿，因此只有在这个志愿
+            # 无法满足时才跳过它。
+            if not feasible:
+                choice.append(len(wishes[index]))
+                search(index + 1, occupied, skipped + (1,))
+                choice.pop()
+
+        search(0, self._occupied, ())
+        self._plan = [wish[i] for wish, i in zip(wishes, best_choice) if i < len(wish)]
+        return self.plan
+
+
+__all__ = ("ElectionPlanner",)
@@ -0,0 +1,235 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import contextvars
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import urlparse
+
+import requests
+
+from suep_toolkit import deadline
+from suep_toolkit.transport import AdapterWrapper
+from suep_toolkit.transport import install as install_wrapper
+from suep_toolkit.util import DeadlineExceeded, cache_dir
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock_file(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class Priority(IntEnum):
+    """请求的优先级。"""
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "priority", default=Priority.NORMAL
+)
+
+
+@contextmanager
+def priority(level: Priority) -> Iterator[None]:
+    """在 `with` 语句块中以 `level` 优先级发送请求。"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """多个进程共享的令牌桶。
+
+    令牌数保存在一个通过内存映射共享的小文件中，修改时加文件锁，因此同一台机器上的
+    所有进程共用同一个限额。优先级低的请求不能用完全部令牌：`NORMAL` 和 `LOW`
+    请求会分别为更高优先级的请求保留一部分令牌，并且在有 `HIGH` 请求等待时让路。
+    """
+
+    reserve = {Priority.HIGH: 0.0, Priority.NORMAL: 0.25, Priority.LOW: 0.5}
+    _format = struct.Struct("ddd")
+
+    def __init__(self, path: Path, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked(initialize=True):
+            pass
+        self._map = mmap.mmap(self._fd, self._format.size)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    def acquire(
+        self, level: Priority = Priority.NORMAL, timeout: float | None = None
+    ) -> float:
+        """取走一个令牌，必要时等待。返回等待的秒数。"""
+        start = time.time()
+        while True:
+            with self._locked():
+                tokens, updated, high_waiting = self._format.unpack(self._map)
+                now = time.time()
+                tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                reserve = self.burst * self.reserve[level]
+                yielding = level != Priority.HIGH and high_waiting > now
+                if not yielding and tokens >= 1 + reserve:
+                    self._map[:] = self._format.pack(tokens - 1, now, high_waiting)
+                    return now - start
+                wait = (1 + reserve - tokens) / self.rate
+                if yielding:
+                    wait = max(wait, high_waiting - now)
+                if level == Priority.HIGH:
+                    high_waiting = max(high_waiting, now + wait + 0.05)
+                self._map[:] = self._format.pack(tokens, now, high_waiting)
+            if timeout is not None and now + wait - start > timeout:
+                raise TimeoutError("rate limit wait would exceed the timeout")
+            time.sleep(max(wait, 0.001))
+
+    @contextmanager
+    def _locked(self, initialize: bool = False) -> Iterator[None]:
+        # 文件锁只在进程之间互斥，同一进程中的线程还需要一个普通的锁。
+        with self._lock:
+            _lock_file(self._fd)
+            try:
+                if initialize and os.fstat(self._fd).st_size < self._format.size:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    os.write(self._fd, self._format.pack(self.burst, time.time(), 0))
+                yield
+            finally:
+                _unlock_file(self._fd)
+
+
+class RateLimiter:
+    """按主机限流。
+
+    `limits` 以主机名为键，值为每秒的请求数和突发的请求数。未列出的主机不限流。
+    """
+
+    default_limits = {
+        "jw.shiep.edu.cn": (5.0, 10.0),
+        "10.168.103.76": (2.0, 4.0),
+        "10.50.2.206": (3.0, 6.0),
+        "ids.shiep.edu.cn": (5.0, 10.0),
+        "estudent.shiep.edu.cn": (5.0, 10.0),
+        "pan.shiep.edu.cn": (20.0, 40.0),
+    }
+
+    _shared: "RateLimiter | None" = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]] | None = None,
+        directory: Path | None = None,
+    ) -> None:
+        self._limits = dict(self.default_limits if limits is None else limits)
+        self._directory = directory or cache_dir() / "ratelimit"
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "RateLimiter":
+        """返回进程内共享的、使用默认限额的限流器。"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def acquire(
+        self, host: str, level: Priority | None = None, timeout: float | None = None
+    ) -> float:
+        """为访问 `host` 的请求取走一个令牌，返回等待的秒数。"""
+        if host not in self._limits:
+            return 0.0
+        with self._lock:
+            if host not in self._buckets:
+                rate, burst = self._limits[host]
+                self._buckets[host] = TokenBucket(
+                    self._directory / f"{host}.bucket", rate, burst
+                )
+            bucket = self._buckets[host]
+        return bucket.acquire(_priority.get() if level is None else level, timeout)
+
+
+class RateLimitAdapter(AdapterWrapper):
+    """在发送每个请求之前从限流器中取走一个令牌。"""
+
+    def __init__(self, adapter, limiter: RateLimiter | None = None) -> None:
+        super().__init__(adapter)
+        self.limiter = limiter or RateLimiter.shared()
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        limit = deadline.current()
+        host = urlparse(request.url).hostname or ""
+        if limit is None:
+            self.limiter.acquire(host)
+        else:
+            try:
+                self.limiter.acquire(host, timeout=limit.timeout())
+            except TimeoutError as error:
+                raise DeadlineExceeded("deadline exceeded") from error
+        return self.adapter.send(request, **kwargs)
+
+
+def install(session: requests.Session, limiter: RateLimiter | None = None) -> None:
+    """让会话的所有请求都经过限流器，默认使用进程内共享的限流器。"""
+    install_wrapper(session, lambda adapter: RateLimitAdapter(adapter, limiter))
+
+
+__all__ = (
+    "Priority",
+    "priority",
+    "TokenBucket",
+    "RateLimiter",
+    "RateLimitAdapter",
+    "install",
+)
@@ -0,0 +1,238 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""记录类型的紧凑二进制格式。
+
+每条记录以一个字节的类型编号开头，随后是用 `struct` 打包的定长字段（布尔值、
+浮点数、日期和时间）、值为 `None` 的字段的位图和变长字段的总长度，然后是以 NUL
+分隔的字符串和整数，最后是嵌套的记录（例如 `AccountTransaction` 中的账号和流水）。
+记录之间不需要分隔符，多条记录可以直接拼接在一起：
+
+```python
+data = records.pack_many(my_card.get_transaction(date1, date2))
+transactions = records.unpack_many(data)
+```
+"""
+
+import dataclasses
+import operator
+import struct
+import types
+import typing
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Iterable
+
+from suep_toolkit.course import CourseRecord
+from suep_toolkit.ehall.ecard import (
+    AccountInfo,
+    AccountTransaction,
+    CardStatus,
+    CardTransaction,
+    TransactionCursor,
+)
+from suep_toolkit.electricity import MeterState, RechargeInfo
+from suep_toolkit.estudent import RoomInfo, StudentInfo
+
+# 类型编号写在数据中，只能增加，不能修改已有的编号。
+record_types: dict[int, type] = {
+    1: AccountInfo,
+    2: CardStatus,
+    3: CardTransaction,
+    4: StudentInfo,
+    5: RoomInfo,
+    6: MeterState,
+    7: RechargeInfo,
+    8: CourseRecord,
+    9: AccountTransaction,
+    10: TransactionCursor,
+}
+
+_epoch = datetime(1970, 1, 1)
+_microsecond = timedelta(microseconds=1)
+
+
+def _field_type(hint: Any) -> type:
+    # `X | None` 按 X 处理，是否为 None 记录在位图中。
+    if isinstance(hint, types.UnionType) or typing.get_origin(hint) is typing.Union:
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return hint
+
+
+class _Codec:
+    formats = {bool: "?", float: "d", datetime: "q", date: "i"}
+
+    def __init__(self, tag: int, record_type: type) -> None:
+        hints = typing.get_type_hints(record_type)
+        names = [field.name for field in dataclasses.fields(record_type)]
+        kinds = [_field_type(hints[name]) for name in names]
+        if len(names) > 32:
+            raise TypeError(f"{record_type.__name__} has too many fields")
+        for name, kind in zip(names, kinds):
+            if kind not in self.formats and kind not in (
+                int,
+                str,
+                *record_types.values(),
+            ):
+                raise TypeError(f"unsupported field type {kind!r} of {name!r}")
+        self.tag = tag
+        self.record_type = record_type
+        fixed = [i for i, kind in enumerate(kinds) if kind in self.formats]
+        text = [i for i, kind in enumerate(kinds) if kind in (int, str)]
+        nested = [i for i, kind in enumerate(kinds) if i not in fixed + text]
+        self.header = struct.Struct(
+            "<B" + "".join(self.formats[kinds[i]] for i in fixed) + "II"
+        )
+        self.getter = _getter(names)
+        # 打包时按“定长字段、变长字段、嵌套记录”的顺序排列，解出后再换回原来的顺序。
+        self.layout = fixed + text + nested
+        self.fixed = len(fixed)
+        self.text = len(text)
+        self.encoders = [self._encoders.get(kinds[i]) for i in fixed]
+        self.decoders = [self._decoders.get(kinds[i]) for i in fixed]
+        self.ints = {j for j, i in enumerate(text) if kinds[i] is int}
+        self.nested = [kinds[i] for i in nested]
+        position = {i: j for j, i in enumerate(self.layout)}
+        self.order = _getter([position[i] for i in range(len(names))], item=True)
+
+    _encoders: dict[type, Callable[[Any], Any]] = {
+        datetime: lambda value: (value - _epoch) // _microsecond,
+        date: date.toordinal,
+    }
+    _decoders: dict[type, Callable[[Any], Any]] = {
+        datetime: lambda value: _epoch + timedelta(microseconds=value),
+        date: date.fromordinal,
+    }
+
+    def pack(self, record: Any) -> bytes:
+        values = self.getter(record)
+        nulls = 0
+        for bit, i in enumerate(self.layout):
+            if values[i] is None:
+                nulls |= 1 << bit
+        ordered = [values[i] for i in self.layout]
+        # 值为 None 的定长字段写入 0 占位。
+        fixed = [
+            0 if value is None else value if encode is None else encode(value)
+            for encode, value in zip(self.encoders, ordered[: self.fixed])
+        ]
+        text = [
+            "" if value is None else str(value)
+            for value in ordered[self.fixed : self.fixed + self.text]
+        ]
+        if any("\0" in value for value in text):
+            raise ValueError("text fields cannot contain NUL characters")
+        # 字符串和整数（整数可能超过 64 位，例如课程的上课时间）以 NUL 分隔存储。
+        payload = "\0".join(text).encode()
+        nested = b"".join(
+            pack(value)
+            for value in ordered[self.fixed + self.text :]
+            if value is not None
+        )
+        return (
+            self.header.pack(self.tag, *fixed, nulls, len(payload)) + payload + nested
+        )
+
+    def unpack(self, data: bytes, offset: int) -> tuple[Any, int]:
+        header = self.header.unpack_from(data, offset)
+        offset += self.header.size
+        nulls = header[-2]
+        end = offset + header[-1]
+        fixed = [
+            None if nulls >> bit & 1 else value if decode is None else decode(value)
+            for bit, (decode, value) in enumerate(zip(self.decoders, header[1:-2]))
+        ]
+        text: list[Any] = data[offset:end].decode().split("\0") if self.text > 0 else []
+        for i in range(len(text)):
+            if nulls >> (self.fixed + i) & 1:
+                text[i] = None
+            elif i in self.ints:
+                text[i] = int(text[i])
+        values = fixed + text
+        offset = end
+        for nested_type in self.nested:
+            if nulls >> len(values) & 1:
+                values.append(None)
+                continue
+            value, offset = _unpack_one(data, offset)
+            if type(value) is not nested_type:
+                raise ValueError(f"expect {nested_type.__name__}, got {value!r}")
+            values.append(value)
+        return self.record_type(*self.order(values)), offset
+
+
+def _getter(keys: list, item: bool = False) -> Callable[[Any], tuple]:
+    # attrgetter 和 itemgetter 在只有一个键时返回值本身而不是元组。
+    make = operator.itemgetter if item else operator.attrgetter
+    if len(keys) == 0:
+        return lambda record: ()
+    if len(keys) == 1:
+        getter = make(keys[0])
+        return lambda record: (getter(record),)
+    return make(*keys)
+
+
+_by_tag = {tag: _Codec(tag, record_type) for tag, record_type in record_types.items()}
+_by_type = {codec.record_type: codec for codec in _by_tag.values()}
+
+
+def pack(record: Any) -> bytes:
+    """把一条记录打包成字节串。"""
+    try:
+        codec = _by_type[type(record)]
+    except KeyError:
+        raise TypeError(f"unsupported record type {type(record).__name__}") from None
+    return codec.pack(record)
+
+
+def unpack(data: bytes) -> Any:
+    """从字节串中解出一条记录。"""
+    record, offset = _unpack_one(data, 0)
+    if offset != len(data):
+        raise ValueError("trailing data after the record")
+    return record
+
+
+def pack_many(records: Iterable[Any]) -> bytes:
+    """把多条记录（可以是不同类型的记录）打包成一个字节串。"""
+    return b"".join(map(pack, records))
+
+
+def unpack_many(data: bytes) -> list[Any]:
+    """从 `pack_many` 得到的字节串中解出所有记录。"""
+    records, offset = [], 0
+    while offset < len(data):
+        record, offset = _unpack_one(data, offset)
+        records.append(record)
+    return records
+
+
+def _unpack_one(data: bytes, offset: int) -> tuple[Any, int]:
+    try:
+        codec = _by_tag[data[offset]]
+    except KeyError:
+        raise ValueError(f"unknown record type {data[offset]}") from None
+    return codec.unpack(data, offset)
+
+
+__all__ = "record_types", "pack", "unpack", "pack_many", "unpack_many"
@@ -0,0 +1,203 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import re
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Iterable
+
+import requests
+from bs4 import BeautifulSoup
+
+from suep_toolkit import deadline, user_agent
+from suep_toolkit.util import DeadlineExceeded, cache_dir
+
+
+class SemesterCalendar:
+    """教学日历。
+
+    学期的起止日期会缓存在磁盘上，超过 `max_age` 秒后才会重新向教务处网站确认，
+    网络不可用时继续使用已缓存的日期。计算教学周本身不需要访问网络。
+    """
+
+    jwc_url = "https://jwc.shiep.edu.cn/"
+
+    _default: "SemesterCalendar | None" = None
+    _default_lock = threading.Lock()
+
+    def __init__(
+        self,
+        cache_file: Path | None = None,
+        max_age: float = 7 * 24 * 3600,
+        timeout: float = 5,
+    ) -> None:
+        self._cache_file = cache_file or cache_dir() / "semester.json"
+        self._max_age = max_age
+        self._timeout = timeout
+        self._lock = threading.Lock()
+
+        self._start = 0
+        self._end = 0
+        self._fetched_at = 0.0
+        self._etag: str | None = None
+        self._last_modified: str | None = None
+        self._load()
+
+    @classmethod
+    def default(cls) -> "SemesterCalendar":
+        """返回进程内共享的教学日历。"""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    @property
+    def semester_start(self) -> date:
+        self._revalidate()
+        return date.fromordinal(self._start)
+
+    @property
+    def semester_end(self) -> date:
+        self._revalidate()
+        return date.fromordinal(self._end)
+
+    def week(self, day: date | None = None) -> int:
+        """获取某一天（默认为今天）所在的教学周。
+
+        特别地，`-1` 表示暑假，`-2` 表示寒假。
+        """
+        self._revalidate()
+        return self._week(day or date.today())
+
+    def weeks(self, days: Iterable[date]) -> list[int]:
+        """批量获取多个日期所在的教学周，顺序与 `days` 一致。"""
+        self._revalidate()
+        return [self._week(day) for day in days]
+
+    def is_vacation(self, day: date | None = None) -> bool:
+        """判断某一天（默认为今天）是否在寒暑假中。"""
+        return self.week(day) < 0
+
+    def refresh(self) -> None:
+        """立即向教务处网站确认学期的起止日期。"""
+        with self._lock:
+            self._fetch()
+
+    def _week(self, day: date) -> int:
+        ordinal = day.toordinal()
+        if ordinal < self._start or ordinal > self._end:
+            return -1 if day.month > 5 else -2
+        return (ordinal - self._start) // 7
+
+    def _revalidate(self) -> None:
+        if not self._is_stale():
+            return
+        with self._lock:
+            if not self._is_stale():
+                return
+            if self._end == 0:
+                self._fetch()
+                return
+            try:
+                self._fetch()
+            except DeadlineExceeded:
+                # 时间不够时使用已缓存的日期，下一次调用再确认。
+                pass
+            except (requests.RequestException, ValueError, IndexError):
+                # 离线时继续使用已缓存的日期，并在下一个确认周期再试。
+                self._fetched_at = time.time()
+
+    def _is_stale(self) -> bool:
+        if self._end == 0:
+            return True
+        age = time.time() - self._fetched_at
+        # 放假之后新学期的日期可能还没有公布，此时每天至多确认一次。
+        if date.today().toordinal() > self._end:
+            return age >= min(self._max_age, 24 * 3600)
+        return age >= self._max_age
+
+    def _fetch(self) -> None:
+        headers = {"User-Agent": user_agent}
+        if self._etag is not None:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified is not None:
+            headers["If-Modified-Since"] = self._last_modified
+        response = requests.get(
+            self.jwc_url, headers=headers, timeout=deadline.timeout(self._timeout)
+        )
+        response.raise_for_status()
+
+        if response.status_code != 304:
+            start, end = self._parse(response.text)
+            self._start = start.toordinal()
+            self._end = end.toordinal()
+            self._etag = response.headers.get("ETag")
+            self._last_modified = response.headers.get("Last-Modified")
+        self._fetched_at = time.time()
+        self._save()
+
+    @staticmethod
+    def _parse(text: str) -> tuple[date, date]:
+        # 只需要首页中的两个 div，用正则表达式提取比解析整个页面快得多。
+        start = re.search(r'id="semester_start"[^>]*>\s*([\d-]+)', text)
+        end = re.search(r'id="semester_end"[^>]*>\s*([\d-]+)', text)
+        if start is not None and end is not None:
+            return date.fromisoformat(start.group(1)), date.fromisoformat(end.group(1))
+
+        dom = BeautifulSoup(text, features="html.parser")
+        return (
+            date.fromisoformat(dom.select("div#semester_start")[0].text.strip()),
+            date.fromisoformat(dom.select("div#semester_end")[0].text.strip()),
+        )
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self._cache_file.read_text())
+            self._start = date.fromisoformat(data["semester_start"]).toordinal()
+            self._end = date.fromisoformat(data["semester_end"]).toordinal()
+            self._fetched_at = float(data["fetched_at"])
+            self._etag = data.get("etag")
+            self._last_modified = data.get("last_modified")
+        except (OSError, KeyError, ValueError):
+            self._start = self._end = 0
+            self._fetched_at = 0.0
+
+    def _save(self) -> None:
+        data = {
+            "semester_start": date.fromordinal(self._start).isoformat(),
+            "semester_end": date.fromordinal(self._end).isoformat(),
+            "fetched_at": self._fetched_at,
+            "etag": self._etag,
+            "last_modified": self._last_modified,
+        }
+        temp_file = self._cache_file.with_suffix(".tmp")
+        try:
+            temp_file.write_text(json.dumps(data))
+            temp_file.replace(self._cache_file)
+        except OSError:
+            pass
+
+
+__all__ = ("SemesterCalendar",)
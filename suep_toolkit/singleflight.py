@@ -0,0 +1,148 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Hashable, TypeVar
+
+from suep_toolkit import deadline
+from suep_toolkit.util import DeadlineExceeded
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """合并同时发生的相同请求。
+
+    以相同的 `key` 同时调用 `do()` 或 `do_async()` 时只有第一个调用者真正执行
+    `func`，其余调用者等待并得到同一个结果（或同一个异常）。成功的结果在之后的
+    `window` 秒内还会直接返回给新的调用者。线程和协程的调用可以互相合并。
+
+    等待者只等到自己的截止时间为止。第一个调用者因为截止时间或取消而失败时，
+    这个异常不会交给其它等待者，而是由其中一个等待者重新执行 `func`。
+    """
+
+    def __init__(self, window: float = 0.5) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        # 值为 (future, 过期时间)，正在执行时过期时间为无穷大。
+        self._flights: dict[Hashable, tuple[Future, float]] = {}
+        self._calls = 0
+        self._shared = 0
+
+    @property
+    def calls(self) -> int:
+        """真正执行的次数。"""
+        return self._calls
+
+    @property
+    def shared(self) -> int:
+        """直接得到其它调用者的结果的次数。"""
+        return self._shared
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        """执行 `func`，或者等待正在执行的相同调用的结果。"""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                self._run(key, future, func)
+                return future.result()
+            wait([future], timeout=deadline.timeout())
+            if not future.done():
+                deadline.check()
+                raise DeadlineExceeded("deadline exceeded")
+            if not isinstance(future.exception(), DeadlineExceeded):
+                return future.result()
+
+    async def do_async(self, key: Hashable, func: Callable[[], T]) -> T:
+        """与 `do()` 相同，但是在线程池中执行 `func` 并以协程的方式等待结果。"""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                loop = asyncio.get_running_loop()
+                context = contextvars.copy_context()
+                loop.run_in_executor(None, context.run, self._run, key, future, func)
+            # 取消一个等待者不应当影响其它等待者。
+            wrapped = asyncio.wrap_future(future)
+            # 所有等待者都因为超时离开时，异常也算作已经取出，避免事件循环报告警告。
+            wrapped.add_done_callback(lambda f: f.cancelled() or f.exception())
+            waiter = asyncio.shield(wrapped)
+            try:
+                result = await asyncio.wait_for(waiter, deadline.timeout())
+            except DeadlineExceeded:
+                if leader:
+                    raise
+                continue
+            except asyncio.TimeoutError:
+                if future.done():
+                    raise
+                deadline.check()
+                raise DeadlineExceeded("deadline exceeded")
+            return result
+
+    def forget(self, key: Hashable) -> None:
+        """丢弃 `key` 保存的结果，下一次调用会重新执行。"""
+        with self._lock:
+            entry = self._flights.get(key)
+            if entry is not None and entry[0].done():
+                del self._flights[key]
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        now = time.monotonic()
+        with self._lock:
+            for old_key, (_, expires) in list(self._flights.items()):
+                if expires <= now:
+                    del self._flights[old_key]
+            if key in self._flights:
+                self._shared += 1
+                return self._flights[key][0], False
+            future: Future = Future()
+            self._flights[key] = (future, math.inf)
+            self._calls += 1
+            return future, True
+
+    def _run(self, key: Hashable, future: Future, func: Callable[[], Any]) -> None:
+        try:
+            result = func()
+        except BaseException as error:
+            # 先移除失败的调用，等待者因为 DeadlineExceeded 重试时会重新执行。
+            with self._lock:
+                if self._flights.get(key, (None,))[0] is future:
+                    del self._flights[key]
+            future.set_exception(error)
+            return
+        with self._lock:
+            if self.window > 0:
+                self._flights[key] = (future, time.monotonic() + self.window)
+            else:
+                self._flights.pop(key, None)
+        future.set_result(result)
+
+
+group = SingleFlight()
+
+
+__all__ = "SingleFlight", "group"
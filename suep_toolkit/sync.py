@@ -0,0 +1,476 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import contextvars
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from suep_toolkit.pan import CloudDrive, FileEntry
+from suep_toolkit.ratelimit import Priority, priority
+from suep_toolkit.util import cache_dir
+
+
+@dataclass
+class SyncAction:
+    """同步计划中的一个操作。
+
+    `kind` 可以是 `download`、`upload`、`move_local`、`move_remote`、
+    `delete_local` 或 `delete_remote`。`path` 是相对于同步根目录的路径，
+    移动操作的原路径保存在 `source` 中。
+    """
+
+    kind: str
+    path: str
+    source: str | None = None
+    size: int = 0
+
+
+@dataclass
+class _LocalFile:
+    size: int
+    mtime_ns: int
+    sha256: str | None
+    remote_id: str | None
+    changed: bool
+
+
+class CloudDriveSync:
+    """在云盘目录和本地目录之间同步文件。
+
+    远程目录的结构保存在本地的 SQLite 数据库中。扫描时只会列出对象 ID
+    发生变化的目录，未改变的子树不会产生任何请求。本地文件只有在大小或修改
+    时间改变时才会重新计算摘要。
+
+    `direction` 为 `pull` 时以云盘为准，为 `push` 时以本地目录为准。
+    文件移动通过内容摘要识别，不需要重新传输。
+    """
+
+    def __init__(
+        self,
+        drive: CloudDrive,
+        library_id: str,
+        remote_root: str,
+        local_root: Path,
+        *,
+        direction: str = "pull",
+        delete: bool = False,
+        workers: int = 4,
+        database: Path | None = None,
+    ) -> None:
+        if direction not in ("pull", "push"):
+            raise ValueError("direction must be 'pull' or 'push'")
+        self._drive = drive
+        self._library = library_id
+        self._remote_root = "/" + remote_root.strip("/")
+        self._local_root = Path(local_root).resolve()
+        self._direction = direction
+        self._delete = delete
+        self._workers = workers
+
+        self._db = sqlite3.connect(database or cache_dir() / "pan-sync.sqlite3")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS remote_dir (
+                library TEXT, path TEXT, id TEXT, PRIMARY KEY (library, path)
+            );
+            CREATE TABLE IF NOT EXISTS remote_file (
+                library TEXT, path TEXT, parent TEXT, size INTEGER, mtime REAL,
+                id TEXT, PRIMARY KEY (library, path)
+            );
+            CREATE INDEX IF NOT EXISTS remote_file_parent
+                ON remote_file (library, parent);
+            CREATE TABLE IF NOT EXISTS local_file (
+                root TEXT, path TEXT, size INTEGER, mtime_ns INTEGER, sha256 TEXT,
+                remote_id TEXT, PRIMARY KEY (root, path)
+            );
+            """)
+        self._requests = 0
+        self._vanished: dict[str, tuple] = {}
+
+    def __enter__(self) -> "CloudDriveSync":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def request_count(self) -> int:
+        """扫描云盘目录时发送的请求数。"""
+        return self._requests
+
+    def close(self) -> None:
+        self._db.close()
+
+    def plan(self) -> list[SyncAction]:
+        """扫描两边的文件并计算出最少的操作。"""
+        # 同步在后台进行，不应挤占选课等更重要的请求。
+        with priority(Priority.LOW):
+            remote = self._scan_remote()
+        local = self._scan_local()
+        if self._direction == "pull":
+            return self._plan_pull(remote, local)
+        return self._plan_push(remote, local)
+
+    def run(self, plan: list[SyncAction] | None = None) -> list[SyncAction]:
+        """执行同步计划，返回已执行的操作。"""
+        if plan is None:
+            plan = self.plan()
+        with priority(Priority.LOW):
+            self._run(plan)
+        return plan
+
+    def _run(self, plan: list[SyncAction]) -> None:
+        moves = [action for action in plan if action.kind.startswith("move")]
+        deletes = [action for action in plan if action.kind.startswith("delete")]
+        transfers = [action for action in plan if action.kind in ("download", "upload")]
+
+        # 先创建目录并移动文件，被移走的文件才不会被覆盖；删除放在最后。
+        self._make_remote_dirs(plan)
+        for action in moves:
+            self._execute(action)
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {
+                executor.submit(
+                    contextvars.copy_context().run, self._transfer, action
+                ): action
+                for action in transfers
+            }
+            for future in as_completed(futures):
+                self._record_transfer(futures[future], future.result())
+        for action in deletes:
+            self._execute(action)
+        targets = {action.path for action in plan}
+        for path in self._vanished:
+            if path not in targets:
+                self._db.execute(
+                    "DELETE FROM local_file WHERE root = ? AND path = ?",
+                    (str(self._local_root), path),
+                )
+        self._db.commit()
+
+        if self._direction == "push" and len(plan) > 0:
+            self._bind_remote_ids()
+
+    def _remote_path(self, path: str) -> str:
+        return f"{self._remote_root.rstrip('/')}/{path}"
+
+    def _make_remote_dirs(self, plan: list[SyncAction]) -> None:
+        # 云盘在目录已经存在时会创建一个重命名的新目录，因此只创建确实不存在的目录，
+        # 并且只对最深的一层目录调用一次。
+        needed = {
+            self._remote_path(action.path).rsplit("/", 1)[0]
+            for action in plan
+            if action.kind in ("upload", "move_remote")
+        }
+        needed.discard("")
+        known = {
+            row[0]
+            for row in self._db.execute(
+                "SELECT path FROM remote_dir WHERE library = ?", (self._library,)
+            )
+        }
+        needed -= known
+        for path in sorted(needed):
+            if not any(other.startswith(path + "/") for other in needed):
+                self._drive.make_dir(self._library, path)
+
+    def _scan_remote(self) -> dict[str, tuple[int, str]]:
+        self._requests = 0
+        row = self._db.execute(
+            "SELECT id FROM remote_dir WHERE library = ? AND path = ?",
+            (self._library, self._remote_root),
+        ).fetchone()
+        self._requests += 1
+        dir_id, entries = self._drive.list_dir_if_changed(
+            self._library, self._remote_root, row[0] if row else None
+        )
+        if entries is not None:
+            self._update_dir(self._remote_root, dir_id, entries)
+        self._db.commit()
+
+        prefix = self._remote_root.rstrip("/") + "/"
+        result = {}
+        for path, size, file_id in self._db.execute(
+            "SELECT path, size, id FROM remote_file WHERE library = ? "
+            "AND path LIKE ? ESCAPE '\\'",
+            (self._library, _escape_like(prefix) + "%"),
+        ):
+            result[path[len(prefix) :]] = (size, file_id)
+        return result
+
+    def _update_dir(self, path: str, dir_id: str, entries: list[FileEntry]) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO remote_dir VALUES (?, ?, ?)",
+            (self._library, path, dir_id),
+        )
+        known_dirs = {
+            row[0]: row[1]
+            for row in self._db.execute(
+                "SELECT path, id FROM remote_dir WHERE library = ? "
+                "AND path LIKE ? ESCAPE '\\' AND path NOT LIKE ? ESCAPE '\\'",
+                (
+                    self._library,
+                    _escape_like(path.rstrip("/") + "/") + "%",
+                    _escape_like(path.rstrip("/") + "/") + "%/%",
+                ),
+            )
+        }
+        self._db.execute(
+            "DELETE FROM remote_file WHERE library = ? AND parent = ?",
+            (self._library, path),
+        )
+        subdirs = set()
+        for entry in entries:
+            if entry.type == "dir":
+                subdirs.add(entry.path)
+                # 子目录的对象 ID 没有变化，整个子树都不需要重新列出。
+                if known_dirs.get(entry.path) == entry.id:
+                    continue
+                self._requests += 1
+                self._update_dir(
+                    entry.path,
+                    entry.id,
+                    self._drive.list_dir(self._library, entry.path),
+                )
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO remote_file VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        self._library,
+                        entry.path,
+                        path,
+                        entry.size,
+                        entry.mtime.timestamp(),
+                        entry.id,
+                    ),
+                )
+        for removed in set(known_dirs) - subdirs:
+            pattern = _escape_like(removed + "/") + "%"
+            for table in ("remote_dir", "remote_file"):
+                self._db.execute(
+                    f"DELETE FROM {table} WHERE library = ? "
+                    "AND (path = ? OR path LIKE ? ESCAPE '\\')",
+                    (self._library, removed, pattern),
+                )
+
+    def _scan_local(self) -> dict[str, _LocalFile]:
+        root = str(self._local_root)
+        known = {
+            row[0]: row[1:]
+            for row in self._db.execute(
+                "SELECT path, size, mtime_ns, sha256, remote_id FROM local_file "
+                "WHERE root = ?",
+                (root,),
+            )
+        }
+        result = {}
+        if self._local_root.exists():
+            for directory, _, files in os.walk(self._local_root):
+                for name in files:
+                    full_path = Path(directory, name)
+                    if name.endswith((".part", ".part.json", ".upload.json")):
+                        continue
+                    stat = full_path.stat()
+                    path = full_path.relative_to(self._local_root).as_posix()
+                    row = known.get(path)
+                    if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                        result[path] = _LocalFile(
+                            stat.st_size, stat.st_mtime_ns, row[2], row[3], False
+                        )
+                    elif (
+                        row is not None
+                        and row[0] == stat.st_size
+                        and row[2] is not None
+                        and _file_sha256(full_path) == row[2]
+                    ):
+                        # 只是修改时间变了（例如被 touch 或者恢复成原来的内容），
+                        # 内容没有变化，更新索引中的修改时间即可。
+                        self._db.execute(
+                            "UPDATE local_file SET mtime_ns = ? "
+                            "WHERE root = ? AND path = ?",
+                            (stat.st_mtime_ns, root, path),
+                        )
+                        result[path] = _LocalFile(
+                            stat.st_size, stat.st_mtime_ns, row[2], row[3], False
+                        )
+                    else:
+                        result[path] = _LocalFile(
+                            stat.st_size, stat.st_mtime_ns, None, None, True
+                        )
+        self._db.commit()
+        # 已经不存在的本地文件保留在数据库中，用于识别移动操作。
+        self._vanished = {
+            path: row for path, row in known.items() if path not in result
+        }
+        return result
+
+    def _plan_pull(
+        self, remote: dict[str, tuple[int, str]], local: dict[str, _LocalFile]
+    ) -> list[SyncAction]:
+        plan = []
+        # 内容未改变、但在云盘上已经不存在的本地文件可以作为移动的来源。
+        movable = {
+            info.remote_id: path
+            for path, info in local.items()
+            if path not in remote and not info.changed and info.remote_id
+        }
+        for path, (size, file_id) in sorted(remote.items()):
+            info = local.get(path)
+            if info is not None and not info.changed and info.remote_id == file_id:
+                continue
+            if info is None and file_id in movable:
+                plan.append(SyncAction("move_local", path, movable.pop(file_id), size))
+            else:
+                plan.append(SyncAction("download", path, size=size))
+        if self._delete:
+            moved = {action.source for action in plan if action.kind == "move_local"}
+            for path in sorted(local):
+                if path not in remote and path not in moved:
+                    plan.append(SyncAction("delete_local", path))
+        return plan
+
+    def _plan_push(
+        self, remote: dict[str, tuple[int, str]], local: dict[str, _LocalFile]
+    ) -> list[SyncAction]:
+        plan = []
+        movable = {
+            row[2]: path
+            for path, row in self._vanished.items()
+            if row[2] and path in remote and remote[path][1] == row[3]
+        }
+        for path, info in sorted(local.items()):
+            remote_info = remote.get(path)
+            if (
+                remote_info is not None
+                and not info.changed
+                and info.remote_id == remote_info[1]
+            ):
+                continue
+            if remote_info is None and movable:
+                info.sha256 = info.sha256 or _file_sha256(self._local_root / path)
+                if info.sha256 in movable:
+                    source = movable.pop(info.sha256)
+                    plan.append(SyncAction("move_remote", path, source, info.size))
+                    continue
+            plan.append(SyncAction("upload", path, size=info.size))
+        if self._delete:
+            moved = {action.source for action in plan if action.kind == "move_remote"}
+            for path in sorted(remote):
+                if path not in local and path not in moved:
+                    plan.append(SyncAction("delete_remote", path))
+        return plan
+
+    def _execute(self, action: SyncAction) -> None:
+        root = str(self._local_root)
+        if action.kind == "move_local":
+            target = self._local_root / action.path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            (self._local_root / action.source).replace(target)
+            stat = target.stat()
+            self._db.execute(
+                "UPDATE local_file SET path = ?, size = ?, mtime_ns = ? "
+                "WHERE root = ? AND path = ?",
+                (action.path, stat.st_size, stat.st_mtime_ns, root, action.source),
+            )
+        elif action.kind == "move_remote":
+            self._drive.move(
+                self._library,
+                self._remote_path(action.source),
+                self._remote_path(action.path),
+            )
+            stat = (self._local_root / action.path).stat()
+            self._db.execute(
+                "UPDATE local_file SET path = ?, size = ?, mtime_ns = ? "
+                "WHERE root = ? AND path = ?",
+                (action.path, stat.st_size, stat.st_mtime_ns, root, action.source),
+            )
+        elif action.kind == "delete_local":
+            (self._local_root / action.path).unlink(missing_ok=True)
+            self._db.execute(
+                "DELETE FROM local_file WHERE root = ? AND path = ?",
+                (root, action.path),
+            )
+        elif action.kind == "delete_remote":
+            self._drive.delete(self._library, self._remote_path(action.path))
+
+    def _transfer(self, action: SyncAction) -> str:
+        local_path = self._local_root / action.path
+        if action.kind == "download":
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            result = self._drive.download(
+                self._library, self._remote_path(action.path), local_path
+            )
+        else:
+            parent_dir = self._remote_path(action.path).rsplit("/", 1)[0] or "/"
+            result = self._drive.upload(self._library, local_path, parent_dir)
+        return result.sha256
+
+    def _record_transfer(self, action: SyncAction, sha256: str) -> None:
+        stat = (self._local_root / action.path).stat()
+        remote_id = None
+        if action.kind == "download":
+            row = self._db.execute(
+                "SELECT id FROM remote_file WHERE library = ? AND path = ?",
+                (self._library, self._remote_path(action.path)),
+            ).fetchone()
+            remote_id = row[0] if row else None
+        self._db.execute(
+            "INSERT OR REPLACE INTO local_file VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                str(self._local_root),
+                action.path,
+                stat.st_size,
+                stat.st_mtime_ns,
+                sha256,
+                remote_id,
+            ),
+        )
+
+    def _bind_remote_ids(self) -> None:
+        # 上传和移动之后重新扫描一次（只会列出发生变化的目录），记录新的对象 ID。
+        remote = self._scan_remote()
+        root = str(self._local_root)
+        for path, (_, file_id) in remote.items():
+            self._db.execute(
+                "UPDATE local_file SET remote_id = ? WHERE root = ? AND path = ? "
+                "AND remote_id IS NULL",
+                (file_id, root, path),
+            )
+        self._db.commit()
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _file_sha256(path: Path) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+__all__ = "SyncAction", "CloudDriveSync"
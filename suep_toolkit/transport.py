@@ -0,0 +1,66 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from typing import Callable
+
+import requests
+from requests.adapters import BaseAdapter
+
+
+class AdapterWrapper(BaseAdapter):
+    """包装另一个传输适配器，在发送请求前后加入额外的处理。
+
+    限流、熔断和缓存等功能都通过这种方式作用在会话的所有请求上，它们可以层层叠加。
+    """
+
+    def __init__(self, adapter: BaseAdapter) -> None:
+        super().__init__()
+        self.adapter = adapter
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        return self.adapter.send(request, **kwargs)
+
+    def close(self) -> None:
+        self.adapter.close()
+
+
+def install(
+    session: requests.Session,
+    wrapper: Callable[[BaseAdapter], AdapterWrapper],
+    prefixes: tuple[str, ...] = ("http://", "https://"),
+) -> None:
+    """用 `wrapper` 包装会话中处理 `prefixes` 的适配器。"""
+    for prefix in prefixes:
+        session.mount(prefix, wrapper(session.get_adapter(prefix)))
+
+
+def find(session: requests.Session, cls: type, prefix: str = "https://") -> object:
+    """返回会话中类型为 `cls` 的适配器，不存在时返回 `None`。"""
+    adapter = session.get_adapter(prefix)
+    while isinstance(adapter, AdapterWrapper):
+        if isinstance(adapter, cls):
+            return adapter
+        adapter = adapter.adapter
+    return adapter if isinstance(adapter, cls) else None
+
+
+__all__ = "AdapterWrapper", "install", "find"
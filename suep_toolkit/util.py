@@ -20,13 +20,10 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import socket
+import os
+import sys
 from concurrent.futures import ThreadPoolExecutor
-from datetime import date
-from queue import Queue
-
-import requests
-from bs4 import BeautifulSoup
+from pathlib import Path
 
 
 class AuthServiceError(Exception):
@@ -41,51 +38,72 @@ class VPNError(Exception):
     pass
 
 
+class CircuitOpenError(VPNError):
+    """当某个主机的熔断器打开（该主机暂时无法访问）时引发此异常。"""
+
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    """当调用超过截止时间或被取消时引发此异常，详见 `suep_toolkit.deadline`。"""
+
+    pass
+
+
 def test_network(timeout: float = 0.5) -> bool:
     """检测设备是否连接学校内网。
 
-    若超时时间小于 0.5 秒，则可能会有误报。
+    若超时时间小于 0.5 秒，则可能会有误报。检测结果会同时更新各主机的熔断器，
+    详见 `suep_toolkit.breaker.CircuitBreaker`。
     """
+    from suep_toolkit import deadline
+    from suep_toolkit.breaker import CircuitBreaker
+
+    # 检测在其它线程中进行，因此在这里按照截止时间确定超时时间。
+    timeout = deadline.timeout(timeout)
     ip_addrs = ["10.50.2.206", "10.166.18.114", "10.166.19.26", "10.168.103.76"]
-    test_result = Queue()
+    breaker = CircuitBreaker.shared()
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(
+            executor.map(lambda addr: breaker.probe(addr, 80, timeout), ip_addrs)
+        )
+    return sum(results) / len(ip_addrs) >= 0.5
 
-    def test_helper(addr: str) -> None:
-        try:
-            socket.create_connection((addr, 80), timeout=timeout)
-            test_result.put(1)
-        except TimeoutError:
-            pass
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for addr in ip_addrs:
-            executor.submit(test_helper, addr)
-    count = 0
-    while not test_result.empty():
-        count += test_result.get()
-    return count / len(ip_addrs) >= 0.5
+def cache_dir() -> Path:
+    """返回存放缓存文件的目录，目录不存在时会自动创建。
+
+    可以通过 `SUEP_TOOLKIT_CACHE` 环境变量指定其它目录。
+    """
+    if "SUEP_TOOLKIT_CACHE" in os.environ:
+        path = Path(os.environ["SUEP_TOOLKIT_CACHE"])
+    elif sys.platform == "win32" and "LOCALAPPDATA" in os.environ:
+        path = Path(os.environ["LOCALAPPDATA"]) / "suep_toolkit"
+    else:
+        path = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+        path = path / "suep_toolkit"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
 
 
 def semester_week() -> int:
     """获取当前教学周。
 
     特别地，`-1` 表示暑假，`-2` 表示寒假。
+
+    学期的起止日期会缓存在本地，详见 `suep_toolkit.semester.SemesterCalendar`。
     """
-    jwc_url = "https://jwc.shiep.edu.cn/"
-    response = requests.get(jwc_url)
-    response.raise_for_status()
-    dom = BeautifulSoup(response.text, features="html.parser")
-
-    semeter_start = date.fromisoformat(dom.select("div#semester_start")[0].text)
-    semeter_end = date.fromisoformat(dom.select("div#semester_end")[0].text)
-    if (date.today() - semeter_start).days < 0 or (date.today() - semeter_end).days > 0:
-        return -1 if date.today().month > 5 else -2
-    else:
-        return (date.today() - semeter_start).days // 7
+    from suep_toolkit.semester import SemesterCalendar
+
+    return SemesterCalendar.default().week()
 
 
 __all__ = (
     "AuthServiceError",
     "VPNError",
+    "CircuitOpenError",
+    "DeadlineExceeded",
     "test_network",
+    "cache_dir",
     "semester_week",
 )
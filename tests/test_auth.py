@@ -0,0 +1,60 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+
+import pytest
+import requests
+
+from suep_toolkit.auth import SessionMonitor
+from suep_toolkit.util import AuthServiceError
+
+
+class FakeService:
+    def __init__(self, failures):
+        self.session = requests.Session()
+        self.failures = failures
+        self.calls = 0
+
+    def relogin(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise AuthServiceError("wrong captcha")
+
+
+def test_failed_reauth_is_retried_by_waiters():
+    service = FakeService(failures=1)
+    with SessionMonitor(service, keepalive_interval=None) as monitor:
+        started = time.monotonic()
+        last_login = monitor._last_login
+        with pytest.raises(AuthServiceError):
+            monitor._reauth(started)
+        assert monitor._last_login == last_login
+        # 等待同一把锁的请求不会因为失败的重新登陆而直接返回。
+        monitor._reauth(started)
+        assert service.calls == 2
+        assert monitor._last_login > started
+        monitor._reauth(started)
+        assert service.calls == 2
+    metrics = monitor.metrics
+    assert metrics.reauth_failed == 1
+    assert metrics.reauth_succeeded == 1
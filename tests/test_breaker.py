@@ -0,0 +1,74 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+
+from suep_toolkit.breaker import CircuitBreaker, CircuitBreakerAdapter, State
+from suep_toolkit.ratelimit import RateLimitAdapter, RateLimiter
+
+
+class SlowAdapter(BaseAdapter):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def send(self, request, **kwargs):
+        time.sleep(self.delay)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def breaker(**kwargs):
+    return CircuitBreaker({"h": 80}, failure_threshold=1, probe_interval=999, **kwargs)
+
+
+def test_slow_call_opens_breaker():
+    b = breaker(slow_call=0.05)
+    adapter = CircuitBreakerAdapter(SlowAdapter(0.1), b)
+    adapter.send(requests.Request("GET", "http://h/").prepare())
+    assert b.state("h") is State.OPEN
+
+
+def test_large_upload_is_not_slow_call():
+    b = breaker(slow_call=0.05, large_body=10)
+    adapter = CircuitBreakerAdapter(SlowAdapter(0.1), b)
+    adapter.send(requests.Request("PUT", "http://h/", data=b"x" * 100).prepare())
+    assert b.state("h") is State.CLOSED
+    adapter.send(requests.Request("PUT", "http://h/", data=b"x").prepare())
+    assert b.state("h") is State.OPEN
+
+
+def test_rate_limit_wait_is_not_slow_call(tmp_path):
+    b = breaker(slow_call=0.1)
+    limiter = RateLimiter({"h": (5.0, 2.0)}, tmp_path)
+    adapter = RateLimitAdapter(CircuitBreakerAdapter(SlowAdapter(0), b), limiter)
+    for _ in range(4):
+        adapter.send(requests.Request("GET", "http://h/").prepare())
+    assert b.state("h") is State.CLOSED
@@ -0,0 +1,83 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+from datetime import datetime
+
+import pytest
+
+from suep_toolkit.electricity import RechargeInfo
+from suep_toolkit.estudent import RoomInfo
+from suep_toolkit.export import Schema, Writer, export
+
+
+def recharges(start, count):
+    return [
+        RechargeInfo(i, "电费", i * 1.5, i, datetime(2024, 1, 1, 8, i % 60))
+        for i in range(start, start + count)
+    ]
+
+
+def test_writer_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        Writer(tmp_path / "x", Schema(RechargeInfo))
+
+
+@pytest.mark.parametrize("suffix", ["csv", "jsonl", "parquet"])
+def test_export_then_append(tmp_path, suffix):
+    path = tmp_path / f"recharge.{suffix}"
+    assert export(recharges(0, 5), path) == 5
+    assert export(recharges(5, 3), path, append=True) == 3
+    assert path.is_file()
+    if suffix == "parquet":
+        pq = pytest.importorskip("pyarrow.parquet")
+        rows = pq.read_table(path).to_pylist()
+        assert [row["oid"] for row in rows] == list(range(8))
+        assert rows[7]["time"] == datetime(2024, 1, 1, 8, 7)
+    elif suffix == "jsonl":
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert [json.loads(line)["oid"] for line in lines] == list(range(8))
+    else:
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 9
+
+
+def test_parquet_row_groups_are_kept(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "recharge.parquet"
+    export(recharges(0, 10), path, row_group_size=4)
+    export(recharges(10, 3), path, append=True, row_group_size=4)
+    file = pq.ParquetFile(path)
+    assert file.metadata.num_rows == 13
+    assert file.num_row_groups == 4
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+@pytest.mark.parametrize("suffix", ["csv", "parquet"])
+def test_append_with_different_columns(tmp_path, suffix):
+    if suffix == "parquet":
+        pytest.importorskip("pyarrow")
+    path = tmp_path / f"data.{suffix}"
+    export(recharges(0, 2), path)
+    room = RoomInfo("临港", "C1", "A101", 1, True, "四人间", "在住")
+    with pytest.raises(ValueError):
+        export([room], path, append=True)
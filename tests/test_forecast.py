@@ -0,0 +1,88 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from datetime import datetime, timedelta
+
+from suep_toolkit.electricity import MeterState
+from suep_toolkit.forecast import ElectricityForecaster
+
+START = datetime(2024, 1, 1)
+
+
+class FakeManagement:
+    def __init__(self):
+        self.recharged = []
+
+    @property
+    def recharge_info(self):
+        return iter(())
+
+    def recharge_my_room(self, quantity):
+        self.recharged.append(quantity)
+
+
+def state(reskwh, recharges=0):
+    return MeterState(recharges, reskwh, 0, 220, 1.0, 5, 1)
+
+
+def test_history_is_trimmed():
+    forecaster = ElectricityForecaster(FakeManagement())
+    half_life = forecaster.profile.half_life
+    for hour in range(0, 10 * int(half_life // 3600), 24):
+        forecaster.observe(state(1000 - hour * 0.1), START + timedelta(hours=hour))
+    samples = forecaster.samples
+    assert samples[-1][0] - samples[0][0] <= timedelta(seconds=4 * half_life)
+    assert len(samples) < 10 * half_life / 86400
+
+
+def test_keeps_last_two_samples():
+    forecaster = ElectricityForecaster(FakeManagement())
+    forecaster.observe(state(100), START)
+    forecaster.observe(state(90), START + timedelta(days=365))
+    assert len(forecaster.samples) == 2
+    assert forecaster.profile.fitted
+
+
+def test_auto_recharge_rearms_after_credit():
+    management = FakeManagement()
+    forecaster = ElectricityForecaster(management, auto_recharge=50)
+    at = START
+    reskwh = 30.0
+    forecaster.observe(state(reskwh), at)
+    for _ in range(4):
+        # 每小时用 2 千瓦时，很快就会耗尽。
+        at += timedelta(hours=1)
+        reskwh -= 2
+        forecaster.observe(state(reskwh), at)
+    assert management.recharged == [50]
+    at += timedelta(hours=1)
+    forecaster.observe(state(reskwh - 2), at)
+    assert management.recharged == [50]
+    # 充值到账之后电量变多，下一次即将耗尽时再次充值。
+    reskwh += 50
+    at += timedelta(hours=1)
+    forecaster.observe(state(reskwh, 1), at)
+    for _ in range(40):
+        at += timedelta(hours=1)
+        reskwh -= 2
+        forecaster.observe(state(reskwh, 1), at)
+    assert management.recharged == [50, 50]
@@ -0,0 +1,105 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import io
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from urllib3 import HTTPResponse
+
+from suep_toolkit import httpcache
+from suep_toolkit.httpcache import CacheRule, ResponseCache
+
+url = "http://example.test/data"
+body = "第一行\nsecond line\n".encode() * 100
+
+
+class FakeAdapter(BaseAdapter):
+    """返回固定内容的 gzip 压缩响应，并记录请求次数。"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        compressed = gzip.compress(body)
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = request.url
+        response.request = request
+        response.headers = requests.structures.CaseInsensitiveDict(
+            {
+                "Content-Type": "text/plain; charset=utf-8",
+                "Content-Encoding": "gzip",
+                "Content-Length": str(len(compressed)),
+            }
+        )
+        response.encoding = "utf-8"
+        response.raw = HTTPResponse(
+            body=io.BytesIO(compressed),
+            headers=dict(response.headers),
+            status=200,
+            preload_content=False,
+        )
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def session(tmp_path):
+    adapter = FakeAdapter()
+    cache = ResponseCache("user", {url: CacheRule(3600)}, directory=tmp_path)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    httpcache.install(session, cache)
+    yield session, adapter, cache
+    cache.close()
+
+
+def test_cached_response_can_be_iterated_and_closed(session):
+    session, adapter, cache = session
+    assert session.get(url).content == body
+    with session.get(url, stream=True) as response:
+        assert adapter.calls == 1
+        assert cache.info().hits == 1
+        assert b"".join(response.iter_content(chunk_size=7)) == body
+        assert list(response.iter_lines()) == body.splitlines()
+        assert response.text == body.decode()
+        response.close()
+    response = session.get(url)
+    assert response.raw.read() == body
+    response.close()
+    assert adapter.calls == 1
+
+
+def test_no_cache_bypasses_the_cache(session):
+    session, adapter, _ = session
+    session.get(url)
+    with httpcache.no_cache():
+        assert session.get(url).content == body
+    assert adapter.calls == 2
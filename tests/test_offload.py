@@ -0,0 +1,76 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+
+import requests
+
+from suep_toolkit import offload
+from suep_toolkit.offload import ParsePool
+
+
+def response(text):
+    response = requests.Response()
+    response._content = text.encode()
+    response.encoding = "utf-8"
+    return response
+
+
+def test_run_without_pool():
+    assert offload.run(str.upper, response("abc")) == "ABC"
+
+
+def test_nested_blocks_share_pool():
+    pool = ParsePool(max_workers=1)
+    with pool:
+        with pool:
+            assert offload.run(str.upper, response("abc")) == "ABC"
+        assert offload.run(str.upper, response("def")) == "DEF"
+    assert offload.run(str.upper, response("ghi")) == "GHI"
+
+
+def test_pool_entered_from_threads():
+    pool = ParsePool(max_workers=1)
+    inside = threading.Event()
+    leave = threading.Event()
+    results = []
+
+    def worker():
+        with pool:
+            inside.set()
+            leave.wait(5)
+            results.append(offload.run(str.upper, response("abc")))
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    inside.wait(5)
+    with pool:
+        pass
+    leave.set()
+    thread.join(5)
+    assert results == ["ABC"]
+
+
+def test_pipeline_keeps_order():
+    with ParsePool(max_workers=2):
+        texts = [str(i) * 3 for i in range(10)]
+        assert list(offload.pipeline(map(response, texts), str.upper, 3)) == texts
@@ -0,0 +1,120 @@
+# suep-toolkit, A toolkit for students at Shanghai University of Electric Power.
+#
+# Copyright (c) 2024 zhengxyz123
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from datetime import date, datetime
+
+import pytest
+
+from suep_toolkit import records
+from suep_toolkit.course import CourseRecord
+from suep_toolkit.ehall.ecard import (
+    AccountInfo,
+    AccountTransaction,
+    CardStatus,
+    CardTransaction,
+    TransactionCursor,
+)
+from suep_toolkit.electricity import MeterState, RechargeInfo
+from suep_toolkit.estudent import RoomInfo, StudentInfo
+
+transaction = CardTransaction(
+    datetime(2024, 3, 1, 12, 30, 5, 123456), "消费", "第一食堂", -12.5, "正常", ""
+)
+samples = [
+    AccountInfo(1234, "张三"),
+    AccountInfo(0, ""),
+    CardStatus(88.8, False, True),
+    transaction,
+    CardTransaction(datetime(1969, 12, 31, 23, 59), "", "café ☕", 0.0, "", "备注"),
+    StudentInfo(
+        "20241234",
+        "李四",
+        "男",
+        "",
+        "汉族",
+        "电气工程及其自动化",
+        "电气工程学院",
+        "2024101",
+        "本科",
+        4,
+        "2024",
+        "",
+        "王老师",
+        "在读",
+    ),
+    RoomInfo("临港", "C1", "A101", 2, True, "四人间", "在住"),
+    MeterState(3, 12.34, 150, 220, 0.98, 10, 1),
+    RechargeInfo(1, "电费", 50.0, 100, datetime(2024, 1, 2, 3, 4, 5)),
+    CourseRecord("大学物理", 42, "1234567.01", "88", 1 << 100 | 1),
+    CourseRecord("", 0, "", ""),
+    AccountTransaction(AccountInfo(1234, "张三"), transaction),
+    TransactionCursor(1234, date(2024, 1, 1), date(2024, 2, 1)),
+    TransactionCursor(
+        1234, date(2024, 1, 1), date(2024, 2, 1), 1, 3, 5, "2024-01-01|1.0|消费|店"
+    ),
+]
+
+# 字段的值在抓取到的数据不完整时可能为 None。
+none_samples = [
+    AccountInfo(1, None),
+    CardTransaction(None, None, "店", None, "", None),
+    RoomInfo(None, "", "A101", None, None, "", ""),
+    RechargeInfo(1, None, 1.0, None, None),
+    AccountTransaction(None, transaction),
+    AccountTransaction(AccountInfo(None, None), None),
+]
+
+
+@pytest.mark.parametrize("record", samples + none_samples, ids=repr)
+def test_round_trip(record):
+    data = records.pack(record)
+    assert data[0] in records.record_types
+    decoded = records.unpack(data)
+    assert type(decoded) is type(record)
+    assert decoded == record
+
+
+def test_every_record_type_is_covered():
+    assert {type(record) for record in samples} == set(records.record_types.values())
+
+
+def test_round_trip_many():
+    data = records.pack_many(samples + none_samples)
+    assert records.unpack_many(data) == samples + none_samples
+    assert records.unpack_many(b"") == []
+
+
+def test_empty_and_none_are_distinct():
+    assert records.unpack(records.pack(AccountInfo(1, ""))).name == ""
+    assert records.unpack(records.pack(AccountInfo(1, None))).name is None
+    assert records.unpack(records.pack(AccountInfo(1, "None"))).name == "None"
+
+
+def test_errors():
+    with pytest.raises(TypeError):
+        records.pack(object())
+    with pytest.raises(ValueError):
+        records.pack(AccountInfo(1, "a\0b"))
+    with pytest.raises(ValueError):
+        records.unpack(records.pack(AccountInfo(1, "a")) + b"\0")
+    with pytest.raises(ValueError):
+        records.unpack(b"\xff")